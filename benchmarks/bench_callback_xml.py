@@ -0,0 +1,81 @@
+"""
+@Time : 2026/10/17 12:00
+@Author : black_samurai
+@File : bench_callback_xml.py
+@description : 回调消息XML微基准，对比逐字段find解析/字符串拼接回复与单次遍历解析/模板回复的单条耗时
+
+用法 (在项目根目录执行):
+    python benchmarks/bench_callback_xml.py [循环次数]
+"""
+
+import os
+import sys
+import timeit
+import xml.etree.cElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.WXBizMsgCrypt3 import XMLParse
+from src.callback_message import parse_callback_message, build_text_reply
+
+ENVELOPE = (
+    b"<xml><ToUserName><![CDATA[wwbenchcorp0000001]]></ToUserName>"
+    b"<Encrypt><![CDATA[" + b"RypEvHKD8QQKFhvQ6QleEB4J58tiPdvo+rtK1I9qca6aM/wvqnLSV5zEPeusUiX5L5X/0lWfrf0QADHHhGd3QczcdCUpj911L3vg3W/sYYvuJTs3TUUkSUXxaccAS0qhxchrRYt66wiSpGLYL42aM6A8dTT+6k4aSknmPj48kzJs8qLjvd4Xgpue06DOdnLxAUHzM6+kDZ+HMZfJYuR+LtwGc2hgf5gsijff0ekUNXZiqATP7PF5mZxZ3Izoun1s4zG4LUMnvw2r+KqCKIw+3IQH03v+BCA9nMELNqbSf6tiWSrXJB3LAVGUcallcrw8V2t9EL4EhzJWrQUax5wLVMNS0+rUPA3k22Ncx4XXZS9o0MBH27Bo6BpNelZpS" + b"]]></Encrypt>"
+    b"<AgentID><![CDATA[1000001]]></AgentID></xml>"
+)
+
+MESSAGE = (
+    "<xml><ToUserName><![CDATA[wwbenchcorp0000001]]></ToUserName>"
+    "<FromUserName><![CDATA[BenchUser]]></FromUserName>"
+    "<CreateTime>1348831860</CreateTime><MsgType><![CDATA[text]]></MsgType>"
+    "<Content><![CDATA[今天天气怎么样？]]></Content><MsgId>1234567890123456</MsgId>"
+    "<AgentID>1000001</AgentID></xml>"
+).encode()
+
+REPLY_CONTENT = "今天扬州多云，气温18~25度，东南风3级。" * 4
+
+
+def old_extract():
+    return ET.fromstring(ENVELOPE).find("Encrypt").text
+
+
+def new_extract():
+    return XMLParse().extract(ENVELOPE)[1]
+
+
+def old_parse():
+    xml_tree = ET.fromstring(MESSAGE)
+    fields = [xml_tree.find(tag) for tag in ("CreateTime", "MsgType", "ToUserName", "FromUserName", "AgentID", "MsgId", "Content")]
+    return [f.text if f is not None else None for f in fields]
+
+
+def new_parse():
+    msg = parse_callback_message(MESSAGE)
+    return [msg.CreateTime, msg.MsgType, msg.ToUserName, msg.FromUserName, msg.AgentID, msg.MsgId, msg.Content]
+
+
+def old_build():
+    return "<xml><ToUserName>" + "wwbenchcorp0000001" + "</ToUserName><FromUserName>" + "BenchUser" + "</FromUserName><CreateTime>" + "1348831860" + "</CreateTime><MsgType>text</MsgType><Content>" + REPLY_CONTENT + "</Content><AgentID>" + "1000001" + "</AgentID></xml>"
+
+
+def new_build():
+    return build_text_reply("wwbenchcorp0000001", "BenchUser", "1348831860", REPLY_CONTENT, "1000001")
+
+
+def bench(name, func, n):
+    per_call = min(timeit.repeat(func, number=n, repeat=3)) / n
+    print(f"{name:<28} {per_call * 1e6:>8.2f} us/条")
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    assert old_extract() == new_extract()
+    assert old_parse() == new_parse()
+
+    print(f"--- 回调消息XML微基准 ({n} 次 x 3 轮取最优) ---")
+    bench("外层密文提取 (ET解析)", old_extract, n)
+    bench("外层密文提取 (定位CDATA)", new_extract, n)
+    bench("消息解析 (逐字段find)", old_parse, n)
+    bench("消息解析 (单次遍历)", new_parse, n)
+    bench("回复构造 (字符串拼接)", old_build, n)
+    bench("回复构造 (模板+CDATA转义)", new_build, n)
@@ -0,0 +1,98 @@
+"""
+@Time : 2026/10/17 17:40
+@Author : black_samurai
+@File : bench_conversation_store.py
+@description : 对话记忆内存基准，模拟大量用户各进行3轮对话，统计对话存储的进程RSS增量和每用户占用
+
+用法 (在项目根目录执行):
+    python benchmarks/bench_conversation_store.py [用户数] [--legacy 用户数]
+
+    --legacy 额外按旧方式为每个用户创建 ConversationChain + ChatOpenAI 作对比 (需安装langchain，建议几百个用户后按比例估算)
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.conversation_store import ConversationStore
+
+QUESTION = "帮我写一份周报，内容包括本周完成的需求开发、线上问题排查和下周计划。" * 2
+ANSWER = "好的，以下是本周周报：一、本周完成：需求开发三项，线上问题排查两次；二、下周计划：继续推进性能优化。" * 4
+
+
+def current_rss():
+    """读取当前进程的RSS (字节)，仅支持Linux"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def measure(name, build, users):
+    gc.collect()
+    rss_before = current_rss()
+    tracemalloc.start()
+    start = time.perf_counter()
+    holder = build(users)
+    elapsed = time.perf_counter() - start
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    rss_delta = current_rss() - rss_before
+    print(
+        f"{name}: {users} 个用户, 耗时 {elapsed:.2f} 秒, "
+        f"RSS增量 {rss_delta / 1024 / 1024:.1f} MB, Python分配 {traced / 1024 / 1024:.1f} MB, "
+        f"每用户约 {traced / users / 1024:.1f} KB"
+    )
+    return holder
+
+
+def build_store(users):
+    # 内存上限放宽，确保全部用户都保留在存储中
+    store = ConversationStore(max_users=users, max_bytes=1 << 40)
+    for i in range(users):
+        user = f"user{i:05d}"
+        for turn in range(3):
+            store.append_turn(user, f"{turn}:{QUESTION}", f"{turn}:{ANSWER}")
+    return store
+
+
+def build_legacy(users):
+    from langchain_openai import ChatOpenAI
+    from langchain.chains import ConversationChain
+    from langchain.memory import ConversationBufferWindowMemory
+    from langchain.prompts import PromptTemplate
+
+    prompt = PromptTemplate(input_variables=["history", "input"], template="{history}\n{input}")
+    user_model_data = {}
+    for i in range(users):
+        conversation = ConversationChain(
+            llm=ChatOpenAI(model="gpt-4o-mini", api_key="sk-bench"),
+            prompt=prompt,
+            memory=ConversationBufferWindowMemory(k=3),
+        )
+        for turn in range(3):
+            conversation.memory.save_context({"input": f"{turn}:{QUESTION}"}, {"output": f"{turn}:{ANSWER}"})
+        user_model_data[f"user{i:05d}"] = conversation
+    return user_model_data
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    legacy_users = 0
+    if '--legacy' in args:
+        index = args.index('--legacy')
+        legacy_users = int(args[index + 1]) if index + 1 < len(args) else 200
+        del args[index:index + 2]
+    users = int(args[0]) if args else 10000
+
+    print("--- 对话记忆内存基准 ---")
+    store = measure("ConversationStore", build_store, users)
+    print(f"  存储统计的文本字节数: {store.memory_usage() / 1024 / 1024:.1f} MB")
+    if legacy_users:
+        measure("ConversationChain/用户 (旧)", build_legacy, legacy_users)
@@ -0,0 +1,70 @@
+"""
+@Time : 2026/10/17 11:00
+@Author : black_samurai
+@File : bench_crypto.py
+@description : 回调加解密吞吐基准，对比每个请求新建 WXBizMsgCrypt 与进程内复用加解密器的 解密+验签+加密 吞吐
+
+用法 (在项目根目录执行):
+    python benchmarks/bench_crypto.py [请求次数]
+"""
+
+import base64
+import os
+import sys
+import time
+import xml.etree.cElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.WXBizMsgCrypt3 import WXBizMsgCrypt
+
+TOKEN = "benchtoken"
+CORP_ID = "wwbenchcorp0000001"
+ENCODING_AES_KEY = base64.b64encode(os.urandom(32)).decode().rstrip("=")
+NONCE = "1372623149"
+TIMESTAMP = "1409304348"
+
+INNER_XML = (
+    "<xml><ToUserName><![CDATA[wwbenchcorp0000001]]></ToUserName>"
+    "<FromUserName><![CDATA[BenchUser]]></FromUserName>"
+    "<CreateTime>1348831860</CreateTime><MsgType><![CDATA[text]]></MsgType>"
+    "<Content><![CDATA[今天天气怎么样？]]></Content><MsgId>1234567890123456</MsgId>"
+    "<AgentID>1000001</AgentID></xml>"
+)
+
+
+def build_request():
+    """用加密接口构造一份带签名的回调请求体"""
+    wxcpt = WXBizMsgCrypt(TOKEN, ENCODING_AES_KEY, CORP_ID)
+    ret, post_data = wxcpt.EncryptMsg(INNER_XML, NONCE, TIMESTAMP)
+    assert ret == 0
+    signature = ET.fromstring(post_data).find("MsgSignature").text
+    return post_data, signature
+
+
+def handle(wxcpt, post_data, signature):
+    """模拟一次回调：解密+验签，再加密被动回复"""
+    ret, msg = wxcpt.DecryptMsg(post_data, signature, TIMESTAMP, NONCE)
+    assert ret == 0
+    ret, reply = wxcpt.EncryptMsg(msg.decode(), NONCE, TIMESTAMP)
+    assert ret == 0
+
+
+def bench(name, func, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {n / elapsed:>10.0f} 次/秒   {elapsed / n * 1e6:>8.1f} us/次")
+    return n / elapsed
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    post_data, signature = build_request()
+    shared = WXBizMsgCrypt(TOKEN, ENCODING_AES_KEY, CORP_ID)
+
+    print(f"--- 解密+验签+加密 吞吐基准 ({n} 次) ---")
+    before = bench("每请求新建加解密器", lambda: handle(WXBizMsgCrypt(TOKEN, ENCODING_AES_KEY, CORP_ID), post_data, signature), n)
+    after = bench("进程内复用加解密器", lambda: handle(shared, post_data, signature), n)
+    print(f"提升: {after / before:.2f}x")
@@ -0,0 +1,60 @@
+"""
+@Time : 2026/10/17 23:20
+@Author : black_samurai
+@File : bench_html_extract.py
+@description : HTML邮件正文提取基准，在 html_corpus 中的样例邮件上对比 BeautifulSoup+逐次正则 (旧) 与流式可见文本提取+预编译正则的单封耗时
+
+用法 (在项目根目录执行):
+    python benchmarks/bench_html_extract.py [每封循环次数]
+"""
+
+import glob
+import os
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.send_email_summary import extract_main_body, html_to_text
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html_corpus")
+
+
+def legacy_extract(body_html):
+    """旧实现：BeautifulSoup 提取全部文本，再逐次执行未预编译、未锚定的正则"""
+    soup = BeautifulSoup(body_html, 'html.parser')
+    for script_or_style in soup(['script', 'style']):
+        script_or_style.decompose()
+    text = soup.get_text(separator='\n', strip=True)
+    text = text.replace('&nbsp;', ' ').strip()
+    text = re.split(r'\n-+\s*Original Message\s*-+|\n-+\s*Forwarded message\s*-+|On.*?wrote:|在.*?写道：', text, maxsplit=1)[0]
+    text = '\n'.join(line for line in text.split('\n') if not line.strip().startswith('>'))
+    text = text.split('\n-- \n')[0].strip()
+    return re.sub(r'\n\s*\n', '\n\n', text)
+
+
+def fast_extract(body_html):
+    return extract_main_body(html_to_text(body_html))
+
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.html"))):
+        with open(path, encoding='utf-8') as f:
+            corpus.append((os.path.basename(path), f.read()))
+
+    print(f"--- HTML正文提取基准 ({len(corpus)} 封样例邮件, 每封 {number} 次) ---")
+    print(f"{'样例':<28}{'大小':>8}{'旧(ms)':>10}{'新(ms)':>10}{'加速':>8}{'旧/新字符数':>14}")
+    total_old = total_new = 0.0
+    for name, body_html in corpus:
+        old = timeit.timeit(lambda: legacy_extract(body_html), number=number) / number * 1000
+        new = timeit.timeit(lambda: fast_extract(body_html), number=number) / number * 1000
+        total_old += old
+        total_new += new
+        chars = f"{len(legacy_extract(body_html))}/{len(fast_extract(body_html))}"
+        print(f"{name:<28}{len(body_html) / 1024:>6.1f}KB{old:>10.2f}{new:>10.2f}{old / new:>7.1f}x{chars:>14}")
+    print(f"平均每封: 旧 {total_old / len(corpus):.2f} ms, 新 {total_new / len(corpus):.2f} ms, 加速 {total_old / total_new:.1f}x")
@@ -0,0 +1,125 @@
+"""
+@Time : 2026/10/17 21:40
+@Author : black_samurai
+@File : bench_imap_fetch.py
+@description : 邮件获取基准，在本地IMAP替身上对比逐封获取 (旧) 与服务器端日期搜索+批量FETCH+只取正文部分 (get_emails) 的耗时、命令数和下载字节数
+
+用法 (在项目根目录执行):
+    python benchmarks/bench_imap_fetch.py [邮箱邮件数 ...] [--today 当天邮件数] [--rtt 往返延迟毫秒] [--attach 附件KB]
+
+    默认邮箱规模 200 1000 5000，当天 30 封，每条命令模拟 20ms 往返延迟；
+    --attach 给每隔一封邮件加上指定大小的附件
+"""
+
+import contextlib
+import datetime
+import email
+import imaplib
+import io
+import os
+import sys
+import time
+from email.message import EmailMessage
+from email.utils import format_datetime, parsedate_to_datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_imap_server import FakeIMAPServer
+from src.send_email_summary import get_emails
+
+# 替身服务器使用明文TCP
+imaplib.IMAP4_SSL = imaplib.IMAP4
+
+USER_EMAIL = "me@example.com"
+BODY = "您好，\n\n附件是本周的项目进度报告，请查收并在周五前反馈意见。\n\n谢谢！\n" * 5
+
+
+def build_mailbox(total, today_count, attach_size=0):
+    """生成邮箱：最近 today_count 封为当天邮件，其余每天30封向前排列；attach_size 大于0时每隔一封带附件"""
+    local_tz = datetime.datetime.now().astimezone().tzinfo
+    now = datetime.datetime.now(local_tz).replace(microsecond=0)
+    messages = []
+    for i in range(total):
+        age = total - 1 - i
+        if age < today_count:
+            sent_at = now.replace(hour=0, minute=0, second=0) + datetime.timedelta(minutes=age)
+        else:
+            sent_at = now - datetime.timedelta(days=1 + (age - today_count) // 30, minutes=age % 30)
+        msg = EmailMessage()
+        msg['From'] = f"发件人{i} <sender{i % 50}@partner.com>"
+        msg['To'] = USER_EMAIL
+        msg['Subject'] = f"项目进度报告 {i}"
+        msg['Date'] = format_datetime(sent_at)
+        msg.set_content(BODY)
+        if attach_size and i % 2:
+            msg.add_attachment(os.urandom(attach_size), maintype='application', subtype='pdf', filename=f"报告{i}.pdf")
+        raw = msg.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+        messages.append((1000 + i, sent_at.date(), raw))
+    return messages
+
+
+def legacy_get_emails(port, start_date, end_date, max_scan):
+    """旧实现：SEARCH ALL 后逐封获取Date标头，再逐封下载完整邮件"""
+    mail = imaplib.IMAP4_SSL('127.0.0.1', port)
+    mail.login(USER_EMAIL, 'password')
+    mail.select('INBOX')
+    _, messages = mail.search(None, 'ALL')
+    filtered_ids = []
+    for num in reversed(messages[0].split()[-max_scan:]):
+        _, data = mail.fetch(num, '(BODY[HEADER.FIELDS (DATE)])')
+        email_date = parsedate_to_datetime(email.message_from_bytes(data[0][1])['Date']).date()
+        if start_date <= email_date <= end_date:
+            filtered_ids.append(num)
+        elif email_date < start_date:
+            break
+    results = []
+    for num in filtered_ids:
+        _, data = mail.fetch(num, '(RFC822)')
+        results.append(email.message_from_bytes(data[0][1]))
+    mail.close()
+    mail.logout()
+    return results
+
+
+def measure(name, server, func):
+    server.mailbox.commands = 0
+    server.mailbox.fetched_bytes = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        count = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {name}: {elapsed * 1000:8.1f} ms, {server.mailbox.commands} 条命令, "
+          f"下载 {server.mailbox.fetched_bytes / 1024:.0f} KB, 获取 {count} 封")
+    return elapsed
+
+
+def option(args, name, default):
+    if name in args:
+        index = args.index(name)
+        value = float(args[index + 1])
+        del args[index:index + 2]
+        return value
+    return default
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    today_count = int(option(args, '--today', 30))
+    rtt = option(args, '--rtt', 20) / 1000
+    attach_size = int(option(args, '--attach', 0) * 1024)
+    sizes = [int(arg) for arg in args] or [200, 1000, 5000]
+    today = datetime.date.today()
+
+    print(f"--- IMAP邮件获取基准 (当天 {today_count} 封, 往返延迟 {rtt * 1000:.0f}ms) ---")
+    for size in sizes:
+        server = FakeIMAPServer(build_mailbox(size, today_count, attach_size), rtt=rtt)
+        print(f"邮箱 {size} 封:")
+        old = measure("逐封获取 (旧)", server, lambda: len(legacy_get_emails(server.port, today, today, 200)))
+        new = measure(
+            "日期搜索+批量FETCH+正文部分", server,
+            lambda: len(get_emails('127.0.0.1', server.port, USER_EMAIL, 'password', today, today, 200)[0]),
+        )
+        print(f"  加速 {old / new:.1f}x")
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,118 @@
+"""
+@Time : 2026/10/18 10:30
+@Author : black_samurai
+@File : check_mail_sync.py
+@description : 邮件增量同步检查，在本地IMAP替身上验证缓存往返：超出扫描上限的截断、检查点之后的新邮件、收信日期较早的移入邮件都不会丢失
+
+用法 (在项目根目录执行):
+    python benchmarks/check_mail_sync.py
+"""
+
+import contextlib
+import datetime
+import imaplib
+import io
+import os
+import sys
+import tempfile
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_imap_server import FakeIMAPServer
+from src.mail_cache import MailCache
+from src.send_email_summary import get_emails
+
+# 替身服务器使用明文TCP
+imaplib.IMAP4_SSL = imaplib.IMAP4
+
+USER_EMAIL = "me@example.com"
+MAX_SCAN = 50
+
+
+def make_message(uid, sent_at):
+    msg = EmailMessage()
+    msg['From'] = f"发件人{uid} <sender{uid}@partner.com>"
+    msg['To'] = USER_EMAIL
+    msg['Subject'] = f"邮件 {uid}"
+    msg['Date'] = format_datetime(sent_at)
+    msg.set_content(f"第 {uid} 封邮件的正文。")
+    return msg.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+
+class Scenario:
+    """一个邮箱替身和对应的缓存"""
+
+    def __init__(self, cache_path):
+        local_tz = datetime.datetime.now().astimezone().tzinfo
+        self.now = datetime.datetime.now(local_tz).replace(hour=12, minute=0, second=0, microsecond=0)
+        self.today = self.now.date()
+        self.next_uid = 1000
+        self.server = FakeIMAPServer([])
+        self.cache = MailCache(cache_path)
+        self.expected = set()
+
+    def deliver(self, count, internal_date=None, day=None):
+        """投递邮件：internal_date 为服务器收信日期，day 为 Date 标头的日期，默认都是今天"""
+        sent_at = self.now if day is None else self.now.replace(year=day.year, month=day.month, day=day.day)
+        for _ in range(count):
+            self.server.mailbox.messages.append((self.next_uid, internal_date or sent_at.date(), make_message(self.next_uid, sent_at)))
+            if sent_at.date() == self.today:
+                self.expected.add(self.next_uid)
+            self.next_uid += 1
+
+    def run(self, start_date=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            emails = get_emails(
+                '127.0.0.1', self.server.port, USER_EMAIL, 'password', start_date or self.today, self.today,
+                MAX_SCAN, cache=self.cache,
+            )[0]
+        return {mail['uid'] for mail in emails}
+
+
+def check(name, got, expected):
+    ok = got == expected
+    print(f"  [{'通过' if ok else '失败'}] {name}: 获取 {len(got)} 封, 应为 {len(expected)} 封"
+          + ("" if ok else f", 缺少 {sorted(expected - got)[:10]}, 多出 {sorted(got - expected)[:10]}"))
+    return ok
+
+
+if __name__ == '__main__':
+    print(f"--- 邮件增量同步检查 (扫描上限 {MAX_SCAN}) ---")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        scenario = Scenario(os.path.join(tmp, "email_cache.db"))
+        yesterday = scenario.today - datetime.timedelta(days=1)
+
+        # 当天邮件超过扫描上限：每次运行补齐一部分，检查点在全部复核前不建立
+        scenario.deliver(20, day=yesterday)
+        scenario.deliver(120)
+        results.append(check("首次运行 (截断)", scenario.run(), set(sorted(scenario.expected)[-MAX_SCAN:])))
+        results.append(check("第二次运行 (截断)", scenario.run(), set(sorted(scenario.expected)[-2 * MAX_SCAN:])))
+        results.append(check("第三次运行 (全部复核)", scenario.run(), scenario.expected))
+        state = scenario.cache.get_state(f"{USER_EMAIL}@127.0.0.1/INBOX")
+        results.append(check("建立检查点", {state.last_uid} if state else set(), {scenario.next_uid - 1}))
+
+        # 检查点之后大量新邮件：只复核最近的部分，检查点不越过未复核的邮件
+        checked = set(scenario.expected)
+        scenario.deliver(80)
+        results.append(check("增量运行 (截断)", scenario.run(), checked | set(sorted(scenario.expected - checked)[-MAX_SCAN:])))
+        results.append(check("增量运行 (补齐)", scenario.run(), scenario.expected))
+
+        # 收信日期较早的移入邮件 (Date 为今天) 和新到邮件
+        scenario.deliver(3, internal_date=scenario.today - datetime.timedelta(days=10))
+        scenario.deliver(5)
+        results.append(check("增量运行 (移入邮件)", scenario.run(), scenario.expected))
+
+        # 查询更早的开始日期：重新完整搜索
+        expected_since_yesterday = scenario.expected | {uid for uid in range(1000, 1020)}
+        results.append(check("开始日期早于检查点", scenario.run(start_date=yesterday), expected_since_yesterday))
+        results.append(check("之后的增量运行", scenario.run(), scenario.expected))
+
+        scenario.server.shutdown()
+        scenario.server.server_close()
+
+    print(f"--- {'全部通过' if all(results) else '存在失败'} ---")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,267 @@
+"""
+@Time : 2026/10/17 21:30
+@Author : black_samurai
+@File : fake_imap_server.py
+@description : 本地IMAP服务器替身，供邮件获取基准使用；支持 SEARCH/FETCH 的常用子集，可模拟每条命令的网络往返延迟
+
+只实现基准需要的命令：LOGIN、SELECT/EXAMINE、(UID) SEARCH (ALL/SINCE/BEFORE/UID)、
+(UID) FETCH (UID、FLAGS、RFC822.SIZE、BODYSTRUCTURE、RFC822、BODY[...]<起始.长度>)、CLOSE、LOGOUT。
+使用明文TCP，调用方需把 imaplib.IMAP4_SSL 替换为 imaplib.IMAP4。
+"""
+
+import datetime
+import email
+import functools
+import re
+import socketserver
+import threading
+import time
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+FETCH_ITEM_PATTERN = re.compile(
+    r'BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?|RFC822(?:\.HEADER|\.SIZE)?|BODYSTRUCTURE|UID|FLAGS', re.I
+)
+BODY_SECTION_PATTERN = re.compile(r'BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?', re.I)
+
+
+def parse_imap_date(text):
+    day, month, year = text.split('-')
+    return datetime.date(int(year), MONTHS.index(month) + 1, int(day))
+
+
+def parse_message_set(spec, largest):
+    numbers = set()
+    for part in spec.split(','):
+        if ':' in part:
+            start, end = (largest if value == '*' else int(value) for value in part.split(':'))
+            numbers.update(range(min(start, end), max(start, end) + 1))
+        else:
+            numbers.add(largest if part == '*' else int(part))
+    return numbers
+
+
+def header_block(raw):
+    end = raw.find(b"\r\n\r\n")
+    return raw[:end + 4] if end >= 0 else raw
+
+
+@functools.lru_cache(maxsize=None)
+def parse_message(raw):
+    return email.message_from_bytes(raw)
+
+
+def section_data(raw, section):
+    name = section.upper()
+    if name == '':
+        return raw
+    if name == 'HEADER':
+        return header_block(raw)
+    if name == 'TEXT':
+        return raw[len(header_block(raw)):]
+    if name.startswith('HEADER.FIELDS'):
+        wanted = {field.lower() for field in re.findall(r'[\w-]+', name[len('HEADER.FIELDS'):])}
+        lines, keep = [], False
+        for line in header_block(raw).decode('latin-1').split('\r\n'):
+            if not line:
+                continue
+            if line[0] in ' \t':
+                if keep:
+                    lines.append(line)
+                continue
+            keep = line.split(':', 1)[0].lower() in wanted
+            if keep:
+                lines.append(line)
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+    part = parse_message(raw)
+    for number in (int(value) for value in section.split('.')):
+        if part.is_multipart():
+            part = part.get_payload()[number - 1]
+        elif number != 1:
+            return b""
+    return payload_bytes(part)
+
+
+def payload_bytes(part):
+    # 8bit/7bit 正文的传输编码即原文；base64/quoted-printable 正文本身是ASCII
+    if part.is_multipart():
+        return b""
+    encoding = (part.get('Content-Transfer-Encoding') or '7bit').lower()
+    if encoding in ('7bit', '8bit', 'binary'):
+        return part.get_payload(decode=True) or b""
+    return part.get_payload().encode('ascii', 'replace')
+
+
+def quote(value):
+    if value is None:
+        return 'NIL'
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def body_structure(part):
+    if part.is_multipart():
+        children = "".join(body_structure(child) for child in part.get_payload())
+        return f"({children} {quote(part.get_content_subtype().upper())})"
+    params = (part.get_params() or [])[1:]
+    param_text = "(" + " ".join(f"{quote(k.upper())} {quote(v)}" for k, v in params) + ")" if params else "NIL"
+    raw = payload_bytes(part)
+    encoding = (part.get('Content-Transfer-Encoding') or '7BIT').upper()
+    text = (f"({quote(part.get_content_maintype().upper())} {quote(part.get_content_subtype().upper())} "
+            f"{param_text} NIL NIL {quote(encoding)} {len(raw)}")
+    if part.get_content_maintype() == 'text':
+        text += " " + str(raw.count(b"\n"))
+    disposition = part.get('Content-Disposition')
+    if disposition:
+        filename = part.get_filename()
+        disposition_params = f'("FILENAME" {quote(filename)})' if filename else 'NIL'
+        text += f" NIL ({quote(disposition.split(';')[0].strip().upper())} {disposition_params})"
+    return text + ")"
+
+
+class Mailbox:
+    """邮箱内容与访问统计"""
+
+    def __init__(self, messages, uidvalidity=1):
+        """
+        Args:
+            messages: [(UID, 收信日期 datetime.date, 原始邮件字节), ...]，按UID升序
+            uidvalidity: 邮箱的UIDVALIDITY
+        """
+        self.messages = messages
+        self.uidvalidity = uidvalidity
+        self.commands = 0
+        self.fetched_bytes = 0
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+
+    def send(self, data):
+        self.wfile.write(data.encode() if isinstance(data, str) else data)
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self.send("* OK fake IMAP ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip('\r\n').partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            mailbox.commands += 1
+            if self.server.rtt:
+                time.sleep(self.server.rtt)
+            if command == 'UID':
+                command, _, args = args.partition(' ')
+                command = command.upper()
+                by_uid = True
+            else:
+                by_uid = False
+            if command == 'CAPABILITY':
+                self.send(f"* CAPABILITY IMAP4rev1\r\n{tag} OK done\r\n")
+            elif command in ('LOGIN', 'CLOSE', 'NOOP'):
+                self.send(f"{tag} OK done\r\n")
+            elif command in ('SELECT', 'EXAMINE'):
+                uidnext = max((uid for uid, _, _ in mailbox.messages), default=0) + 1
+                self.send(
+                    f"* {len(mailbox.messages)} EXISTS\r\n* OK [UIDVALIDITY {mailbox.uidvalidity}] ok\r\n"
+                    f"* OK [UIDNEXT {uidnext}] ok\r\n{tag} OK [READ-WRITE] done\r\n"
+                )
+            elif command == 'SEARCH':
+                self.search(tag, args, by_uid)
+            elif command == 'FETCH':
+                self.fetch(tag, args, by_uid)
+            elif command == 'LOGOUT':
+                self.send(f"* BYE bye\r\n{tag} OK logout\r\n")
+                return
+            else:
+                self.send(f"{tag} BAD unknown command\r\n")
+
+    def search(self, tag, args, by_uid):
+        messages = self.server.mailbox.messages
+        selected = list(enumerate(messages, 1))
+        tokens = args.split()
+        i = 0
+        while i < len(tokens):
+            key = tokens[i].upper()
+            if key == 'CHARSET':
+                i += 2
+            elif key == 'SINCE':
+                day = parse_imap_date(tokens[i + 1])
+                selected = [item for item in selected if item[1][1] >= day]
+                i += 2
+            elif key == 'BEFORE':
+                day = parse_imap_date(tokens[i + 1])
+                selected = [item for item in selected if item[1][1] < day]
+                i += 2
+            elif key == 'UID':
+                uids = parse_message_set(tokens[i + 1], max((uid for uid, _, _ in messages), default=0))
+                selected = [item for item in selected if item[1][0] in uids]
+                i += 2
+            else:
+                i += 1
+        ids = " ".join(str(message[0] if by_uid else seq) for seq, message in selected)
+        self.send(f"* SEARCH {ids}\r\n{tag} OK search done\r\n")
+
+    def fetch(self, tag, args, by_uid):
+        mailbox = self.server.mailbox
+        spec, _, items = args.partition(' ')
+        largest = max((uid for uid, _, _ in mailbox.messages), default=0) if by_uid else len(mailbox.messages)
+        wanted = parse_message_set(spec, largest)
+        item_names = FETCH_ITEM_PATTERN.findall(items)
+        response = []
+        for seq, (uid, _, raw) in enumerate(mailbox.messages, 1):
+            if (uid if by_uid else seq) not in wanted:
+                continue
+            fields = [f"UID {uid}".encode()]
+            for item in item_names:
+                name = item.upper()
+                if name == 'UID':
+                    continue
+                if name == 'FLAGS':
+                    fields.append(b"FLAGS ()")
+                    continue
+                if name == 'RFC822.SIZE':
+                    fields.append(f"RFC822.SIZE {len(raw)}".encode())
+                    continue
+                if name == 'BODYSTRUCTURE':
+                    fields.append(("BODYSTRUCTURE " + body_structure(parse_message(raw))).encode())
+                    continue
+                if name == 'RFC822':
+                    data = raw
+                elif name == 'RFC822.HEADER':
+                    data = header_block(raw)
+                else:
+                    match = BODY_SECTION_PATTERN.match(item)
+                    data = section_data(raw, match.group(1))
+                    name = f"BODY[{match.group(1)}]"
+                    if match.group(2) is not None:
+                        offset, length = int(match.group(2)), int(match.group(3))
+                        data = data[offset:offset + length]
+                        name += f"<{offset}>"
+                mailbox.fetched_bytes += len(data)
+                fields.append(f"{name} {{{len(data)}}}\r\n".encode() + data)
+            response.append(f"* {seq} FETCH (".encode() + b" ".join(fields) + b")\r\n")
+        self.send(b"".join(response) + f"{tag} OK fetch done\r\n".encode())
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """在后台线程运行的IMAP替身服务器"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, messages, rtt=0.0, uidvalidity=1):
+        """
+        Args:
+            messages: [(UID, 收信日期, 原始邮件字节), ...]
+            rtt: 每条命令模拟的网络往返延迟（秒）
+            uidvalidity: 邮箱的UIDVALIDITY
+        """
+        super().__init__(('127.0.0.1', 0), IMAPHandler)
+        self.mailbox = Mailbox(messages, uidvalidity)
+        # 真实服务器在投递时已解析邮件结构，替身预先解析，避免解析耗时计入客户端
+        for _, _, raw in messages:
+            parse_message(raw)
+        self.rtt = rtt
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
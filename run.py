@@ -6,24 +6,89 @@
 """
 
 from src.WXBizMsgCrypt3 import WXBizMsgCrypt
+from src.callback_message import parse_callback_message, build_text_reply
 from flask import Flask, request
 import xml.etree.cElementTree as ET
 import sys
 import os
-from collections import deque
+import threading
+import functools
 import src.chat_with_llm as chat_with_llm
+from src.reply_pool import ReplyPool
+from src.msg_dedup import create_msg_dedup, event_dedup_key
+from src.conversation_store import create_conversation_store
+from src.response_cache import create_response_cache
+from src.job_runner import JobRunner
+from src.send_weather_message import run_weather_push
+from src.send_email_summary import run_email_summary
 # 从 dotenv 加载环境变量
 from dotenv import load_dotenv
 
 # 加载 .env 文件
 load_dotenv()
 
-# 全局变量，用于过滤重复消息 (使用deque限制内存使用)
-MsgId_list = deque(maxlen=1000)
-MsgId_set = set()
+# 配置在模块级读取，直接运行和 gunicorn run:app 多worker部署时都能生效
+sToken = os.getenv("sToken")
+sEncodingAESKey = os.getenv("sEncodingAESKey")
+sCorpID = os.getenv("WEIXIN_CORP_ID")
+wxsecret = os.getenv("WEIXIN_CORP_SECRET")
+agentid = os.getenv("WEIXIN_AGENT_ID")
+
+# AI配置
+base_url = os.getenv("AI_BASE_URL")
+api_key = os.getenv("AI_API_KEY")
+model_name = os.getenv("AI_MODEL_NAME")
+
+# 全局变量，用于过滤重复消息 (按时间和数量限制，配置 MSG_DEDUP_DB 时持久化到SQLite)
+msg_dedup = create_msg_dedup()
+
+# 全局变量，用于存放用户对话记忆 (LRU+空闲超时淘汰，限制内存占用)
+conversation_store = create_conversation_store()
+
+# 全局变量，无历史问题的回复缓存 (CHAT_RESPONSE_CACHE 开启时为 ResponseCache，否则为None)
+response_cache = create_response_cache()
+
+# 全局变量，异步回复线程池 (ASYNC_REPLY 开启时初始化)
+# 异步回复模式：回调立即返回，AI回复通过主动消息推送，避免超过企业微信5秒回调时限
+reply_pool = None
+# 全局变量，异步模式下是否流式推送AI回复 (CHAT_STREAMING)
+chat_streaming = False
+if os.getenv("ASYNC_REPLY", "false").lower() in ("1", "true", "yes"):
+    reply_pool = ReplyPool(
+        sCorpID, wxsecret, agentid,
+        max_workers=int(os.getenv("REPLY_WORKERS", 8)),
+        debounce=float(os.getenv("CHAT_DEBOUNCE", 1.0)),
+    )
+    print("已开启异步回复模式")
+    # 流式回复：边生成边推送，首条消息在第一句生成后即发出
+    chat_streaming = os.getenv("CHAT_STREAMING", "false").lower() in ("1", "true", "yes")
+    if chat_streaming:
+        print("已开启流式回复")
+
+# 全局变量，菜单任务执行器 (天气推送、邮件总结在进程内执行，同一用户同一任务不重复执行)
+job_runner = JobRunner(max_workers=int(os.getenv("JOB_WORKERS", 4)))
+job_runner.register("weather", run_weather_push, max_concurrency=int(os.getenv("WEATHER_JOB_CONCURRENCY", 2)))
+job_runner.register("email_summary", run_email_summary, max_concurrency=int(os.getenv("EMAIL_JOB_CONCURRENCY", 2)))
+
+# 全局变量，进程内共享的消息加解密器 (密钥只解码一次)
+wxcpt = None
+wxcpt_lock = threading.Lock()
+
+
+def get_wxcpt():
+    """
+    获取进程内共享的消息加解密器，首次调用时初始化。
+
+    Returns:
+        WXBizMsgCrypt: 消息加解密器
+    """
+    global wxcpt
+    if wxcpt is None:
+        with wxcpt_lock:
+            if wxcpt is None:
+                wxcpt = WXBizMsgCrypt(sToken, sEncodingAESKey, sCorpID)
+    return wxcpt
 
-# 全局变量，用于存放用户数据
-user_model_data = {}
 
 # 初始化Flask应用
 app = Flask(__name__)
@@ -36,8 +101,8 @@ def wechat():
     sVerifyNonce=request.args.get('nonce')
     sVerifyEchoStr=request.args.get('echostr')
     
-    # 初始化微信消息加解密器
-    wxcpt = WXBizMsgCrypt(sToken, sEncodingAESKey, sCorpID)
+    # 获取微信消息加解密器
+    wxcpt = get_wxcpt()
     
     #验证url
     if request.method == 'GET':
@@ -59,58 +124,76 @@ def wechat():
             print("ERR: DecryptMsg ret: " + str(ret))
             sys.exit(1)
             
-        #解析发送的内容并打印 (使用安全的XML解析)
+        #解析发送的内容并打印 (一次遍历取出全部字段)
         try:
-            xml_tree = ET.fromstring(sMsg)
+            msg = parse_callback_message(sMsg)
         except ET.ParseError as e:
             print(f"XML解析错误: {e}")
             return "消息格式错误"
-        CreateTime = xml_tree.find("CreateTime").text
-        MsgType = xml_tree.find("MsgType").text
-        ToUserName = xml_tree.find("ToUserName").text
-        FromUserName = xml_tree.find("FromUserName").text
-        AgentID = xml_tree.find("AgentID").text
-        MsgId_element = xml_tree.find("MsgId")
-        MsgId = MsgId_element.text if MsgId_element is not None else None
+        CreateTime = msg.CreateTime
+        MsgType = msg.MsgType
+        ToUserName = msg.ToUserName
+        FromUserName = msg.FromUserName
+        AgentID = msg.AgentID
+        MsgId = msg.MsgId
+
+        # 过滤企业微信重试推送的重复消息，事件消息没有MsgId，按用户+创建时间排重
+        if MsgType == 'event':
+            Event = msg.Event
+            EventKey = msg.EventKey
+            dedup_key = event_dedup_key(FromUserName, CreateTime, Event, EventKey)
+        else:
+            dedup_key = MsgId
+        if dedup_key and not msg_dedup.check_and_add(dedup_key):
+            print(f"重复消息，忽略: {dedup_key}")
+            return "success"
 
         #构造回复文本
         content = ""
         # 文本消息
-        if MsgType == 'text' and MsgId and MsgId not in MsgId_set:
-            MsgId_list.append(MsgId)
-            MsgId_set.add(MsgId)
+        if MsgType == 'text' and MsgId:
             print('文本消息')
-            text = xml_tree.find("Content").text
+            text = msg.Content
             
             # 输入验证
             if not text or len(text.strip()) == 0:
                 content = "输入不能为空"
             elif len(text) > 1000:
                 content = "输入内容过长"
-            else:
-                print(FromUserName," 输入:",text)
-                  
-            if text == "/clr":
-                user_model_data.clear()
+            elif text == "/clr":
+                conversation_store.clear(FromUserName)
                 content = "对话已清空"
-            
+            elif reply_pool is not None:
+                # 异步模式：立即应答回调，AI回复由后台线程主动推送
+                print(FromUserName," 输入:",text)
+                # 同一用户的连续消息合并为一轮，按用户串行处理；流式模式下回复按句子/段落分多条推送
+                chat_func = chat_with_llm.chat_with_llm_stream if chat_streaming else chat_with_llm.chat_with_llm
+                reply_pool.submit_message(
+                    FromUserName, text,
+                    functools.partial(chat_func, base_url, api_key, model_name, FromUserName,
+                                      conversation_store=conversation_store, response_cache=response_cache),
+                    stream=chat_streaming,
+                )
+                print("已提交后台回复任务")
+                return "success"
             else:
-                content = chat_with_llm.chat_with_llm(base_url, api_key, model_name, FromUserName,text,user_model_data)
+                print(FromUserName," 输入:",text)
+                content = chat_with_llm.chat_with_llm(base_url, api_key, model_name, FromUserName,text,conversation_store,response_cache=response_cache)
             
         elif MsgType == 'event':
-            Event = xml_tree.find("Event").text
-            EventKey = xml_tree.find("EventKey").text
             # content = EventKey
             if Event=='click' and EventKey == '#sendmsg#_0#7599827067206067':
-                    print("开始执行天气推送...")
-                    os.system(f'python src/send_weather_message.py {FromUserName}')
+                    if job_runner.submit("weather", FromUserName):
+                        print("天气推送任务已提交")
+                    else:
+                        print("天气推送任务正在执行中，忽略重复点击")
                     content = ""
-                    print("天气推送执行成功");
             elif Event=='click' and EventKey == '#sendmsg#_1#7599827067206068':
-                    print("开始执行邮件总结...")
-                    os.system(f'python src/send_email_summary.py {FromUserName}')
+                    if job_runner.submit("email_summary", FromUserName):
+                        print("邮件总结任务已提交")
+                    else:
+                        print("邮件总结任务正在执行中，忽略重复点击")
                     content = ""
-                    print("邮件总结执行成功");
 
         else:
             content = "未找到对应项"
@@ -121,7 +204,7 @@ def wechat():
     if len(content) == 0:
         return "no data"
     else:
-        sRespData ="<xml><ToUserName>"+ToUserName+"</ToUserName><FromUserName>"+FromUserName+"</FromUserName><CreateTime>"+CreateTime+"</CreateTime><MsgType>text</MsgType><Content>"+content+"</Content><AgentID>"+AgentID+"</AgentID></xml>"
+        sRespData = build_text_reply(ToUserName, FromUserName, CreateTime, content, AgentID)
         ret,sEncryptMsg=wxcpt.EncryptMsg(sRespData, sReqNonce, sReqTimeStamp)
         if( ret!=0 ):
             print ("ERR: EncryptMsg ret: " + str(ret))
@@ -130,17 +213,4 @@ def wechat():
 
 
 if __name__ == '__main__':
-
-    #config
-    global sToken, sEncodingAESKey, sCorpID, base_url, api_key, model_name
-    sToken = os.getenv("sToken")
-    sEncodingAESKey = os.getenv("sEncodingAESKey")
-    sCorpID = os.getenv("WEIXIN_CORP_ID")
-
-    # AI配置
-    base_url = os.getenv("AI_BASE_URL")
-    api_key = os.getenv("AI_API_KEY")
-    model_name = os.getenv("AI_MODEL_NAME")
-
-
     app.run(host='0.0.0.0',port=1111)
\ No newline at end of file
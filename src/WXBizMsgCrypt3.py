@@ -69,11 +69,22 @@ class XMLParse:
 <Nonce><![CDATA[%(nonce)s]]></Nonce>
 </xml>"""
 
+    ENCRYPT_START = "<Encrypt><![CDATA["
+    ENCRYPT_END = "]]></Encrypt>"
+
     def extract(self, xmltext):
         """提取出xml数据包中的加密消息
         @param xmltext: 待提取的xml字符串
         @return: 提取出的加密消息字符串
         """
+        # 快速路径：密文是base64字符串，直接定位CDATA段，无需整体解析XML
+        text = xmltext.decode('utf8', errors='ignore') if isinstance(xmltext, bytes) else xmltext
+        start = text.find(self.ENCRYPT_START)
+        if start != -1:
+            start += len(self.ENCRYPT_START)
+            end = text.find(self.ENCRYPT_END, start)
+            if end != -1:
+                return ierror.WXBizMsgCrypt_OK, text[start:end]
         try:
             xml_tree = ET.fromstring(xmltext)
             encrypt = xml_tree.find("Encrypt")
@@ -105,6 +116,8 @@ class PKCS7Encoder():
     """提供基于PKCS7算法的加解密接口"""
 
     block_size = 32
+    # 预先生成各长度的补位字节串，避免每次加密重新拼接
+    pads = [bytes([n]) * n for n in range(block_size + 1)]
 
     def encode(self, text):
         """ 对需要加密的明文进行填充补位
@@ -117,8 +130,7 @@ class PKCS7Encoder():
         if amount_to_pad == 0:
             amount_to_pad = self.block_size
         # 获得补位所用的字符
-        pad = chr(amount_to_pad)
-        return text + (pad * amount_to_pad).encode()
+        return text + self.pads[amount_to_pad]
 
     def decode(self, decrypted):
         """删除解密后明文的补位字符
@@ -138,8 +150,11 @@ class Prpcrypt(object):
 
         # self.key = base64.b64decode(key+"=")
         self.key = key
+        # CBC模式的初始向量固定为密钥前16位，预先截取
+        self.iv = key[:16]
         # 设置加解密模式为AES的CBC模式
         self.mode = AES.MODE_CBC
+        self.pkcs7 = PKCS7Encoder()
 
     def encrypt(self, text, receiveid):
         """对明文进行加密
@@ -151,10 +166,9 @@ class Prpcrypt(object):
         text = self.get_random_str() + struct.pack("I", socket.htonl(len(text))) + text + receiveid.encode()
 
         # 使用自定义的填充方式对明文进行补位填充
-        pkcs7 = PKCS7Encoder()
-        text = pkcs7.encode(text)
-        # 加密
-        cryptor = AES.new(self.key, self.mode, self.key[:16])
+        text = self.pkcs7.encode(text)
+        # 加密 (CBC模式的cipher对象有状态，每条消息单独创建，保证多线程安全)
+        cryptor = AES.new(self.key, self.mode, self.iv)
         try:
             ciphertext = cryptor.encrypt(text)
             # 使用BASE64对加密后的字符串进行编码
@@ -170,7 +184,7 @@ class Prpcrypt(object):
         @return: 删除填充补位后的明文
         """
         try:
-            cryptor = AES.new(self.key, self.mode, self.key[:16])
+            cryptor = AES.new(self.key, self.mode, self.iv)
             # 使用BASE64对密文进行解码，然后AES-CBC解密
             plain_text = cryptor.decrypt(base64.b64decode(text))
         except Exception as e:
@@ -214,6 +228,10 @@ class WXBizMsgCrypt(object):
             # return ierror.WXBizMsgCrypt_IllegalAesKey,None
         self.m_sToken = sToken
         self.m_sReceiveId = sReceiveId
+        # 签名、XML解析、AES加解密辅助对象均无状态，随实例复用，避免每条消息重复构造
+        self.sha1 = SHA1()
+        self.xmlParse = XMLParse()
+        self.pc = Prpcrypt(self.key)
 
         # 验证URL
         # @param sMsgSignature: 签名串，对应URL参数的msg_signature
@@ -224,14 +242,12 @@ class WXBizMsgCrypt(object):
         # @return：成功0，失败返回对应的错误码
 
     def VerifyURL(self, sMsgSignature, sTimeStamp, sNonce, sEchoStr):
-        sha1 = SHA1()
-        ret, signature = sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, sEchoStr)
+        ret, signature = self.sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, sEchoStr)
         if ret != 0:
             return ret, None
         if not signature == sMsgSignature:
             return ierror.WXBizMsgCrypt_ValidateSignature_Error, None
-        pc = Prpcrypt(self.key)
-        ret, sReplyEchoStr = pc.decrypt(sEchoStr, self.m_sReceiveId)
+        ret, sReplyEchoStr = self.pc.decrypt(sEchoStr, self.m_sReceiveId)
         return ret, sReplyEchoStr
 
     def EncryptMsg(self, sReplyMsg, sNonce, timestamp=None):
@@ -241,20 +257,17 @@ class WXBizMsgCrypt(object):
         # @param sNonce: 随机串，可以自己生成，也可以用URL参数的nonce
         # sEncryptMsg: 加密后的可以直接回复用户的密文，包括msg_signature, timestamp, nonce, encrypt的xml格式的字符串,
         # return：成功0，sEncryptMsg,失败返回对应的错误码None
-        pc = Prpcrypt(self.key)
-        ret, encrypt = pc.encrypt(sReplyMsg, self.m_sReceiveId)
-        encrypt = encrypt.decode('utf8')
+        ret, encrypt = self.pc.encrypt(sReplyMsg, self.m_sReceiveId)
         if ret != 0:
             return ret, None
+        encrypt = encrypt.decode('utf8')
         if timestamp is None:
             timestamp = str(int(time.time()))
         # 生成安全签名
-        sha1 = SHA1()
-        ret, signature = sha1.getSHA1(self.m_sToken, timestamp, sNonce, encrypt)
+        ret, signature = self.sha1.getSHA1(self.m_sToken, timestamp, sNonce, encrypt)
         if ret != 0:
             return ret, None
-        xmlParse = XMLParse()
-        return ret, xmlParse.generate(encrypt, signature, timestamp, sNonce)
+        return ret, self.xmlParse.generate(encrypt, signature, timestamp, sNonce)
 
     def DecryptMsg(self, sPostData, sMsgSignature, sTimeStamp, sNonce):
         # 检验消息的真实性，并且获取解密后的明文
@@ -265,16 +278,13 @@ class WXBizMsgCrypt(object):
         #  xml_content: 解密后的原文，当return返回0时有效
         # @return: 成功0，失败返回对应的错误码
         # 验证安全签名
-        xmlParse = XMLParse()
-        ret, encrypt = xmlParse.extract(sPostData)
+        ret, encrypt = self.xmlParse.extract(sPostData)
         if ret != 0:
             return ret, None
-        sha1 = SHA1()
-        ret, signature = sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, encrypt)
+        ret, signature = self.sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, encrypt)
         if ret != 0:
             return ret, None
         if not signature == sMsgSignature:
             return ierror.WXBizMsgCrypt_ValidateSignature_Error, None
-        pc = Prpcrypt(self.key)
-        ret, xml_content = pc.decrypt(encrypt, self.m_sReceiveId)
+        ret, xml_content = self.pc.decrypt(encrypt, self.m_sReceiveId)
         return ret, xml_content
@@ -0,0 +1,112 @@
+"""
+@Time : 2026/10/17 11:40
+@Author : black_samurai
+@File : callback_message.py
+@description : 回调消息解析与被动回复构造，一次遍历取出全部字段，回复按模板生成并做CDATA转义
+"""
+
+import xml.etree.cElementTree as ET
+
+
+class CallbackMessage:
+    """
+    解密后的回调消息记录。
+
+    常用字段直接存放在 __slots__ 中，按属性名读取 (如 msg.MsgType)，消息中没有的字段为None；
+    其余字段存放在 extra 字典中，可通过 get() 读取。
+    """
+
+    FIELDS = ('ToUserName', 'FromUserName', 'CreateTime', 'MsgType', 'AgentID',
+              'MsgId', 'Content', 'Event', 'EventKey')
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, None)
+        self.extra = {}
+
+    def get(self, name, default=None):
+        """读取任意字段，不存在时返回 default"""
+        if name in self.FIELDS:
+            value = getattr(self, name)
+            return default if value is None else value
+        return self.extra.get(name, default)
+
+    def __repr__(self):
+        fields = {name: getattr(self, name) for name in self.FIELDS if getattr(self, name) is not None}
+        fields.update(self.extra)
+        return f"CallbackMessage({fields!r})"
+
+
+def parse_callback_message(xml_data):
+    """
+    解析解密后的回调消息XML，对一级子节点只遍历一次。
+
+    Args:
+        xml_data: 解密后的XML (bytes 或 str)
+
+    Returns:
+        CallbackMessage: 消息记录
+
+    Raises:
+        ET.ParseError: XML格式错误
+    """
+    root = ET.fromstring(xml_data)
+    msg = CallbackMessage()
+    fields = CallbackMessage.FIELDS
+    for child in root:
+        if child.tag in fields:
+            setattr(msg, child.tag, child.text)
+        else:
+            msg.extra[child.tag] = child.text
+    return msg
+
+
+# 被动回复文本消息模板
+TEXT_REPLY_TEMPLATE = (
+    "<xml>"
+    "<ToUserName><![CDATA[%(to_user)s]]></ToUserName>"
+    "<FromUserName><![CDATA[%(from_user)s]]></FromUserName>"
+    "<CreateTime>%(create_time)s</CreateTime>"
+    "<MsgType><![CDATA[text]]></MsgType>"
+    "<Content><![CDATA[%(content)s]]></Content>"
+    "<AgentID>%(agent_id)s</AgentID>"
+    "</xml>"
+)
+
+
+def cdata_escape(text):
+    """
+    转义CDATA中的结束标记，避免内容提前截断CDATA段。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        str: 可安全放入CDATA的文本
+    """
+    return str(text).replace("]]>", "]]]]><![CDATA[>")
+
+
+def build_text_reply(to_user, from_user, create_time, content, agent_id):
+    """
+    构造被动回复的文本消息XML。
+
+    Args:
+        to_user: ToUserName
+        from_user: FromUserName
+        create_time: 消息创建时间，原样写入，缺失 (None) 时写为空
+        content: 回复内容
+        agent_id: 应用AgentID，原样写入，缺失 (None) 时写为空
+
+    Returns:
+        str: 回复消息XML
+    """
+    return TEXT_REPLY_TEMPLATE % {
+        'to_user': cdata_escape(to_user),
+        'from_user': cdata_escape(from_user),
+        'create_time': '' if create_time is None else create_time,
+        'content': cdata_escape(content),
+        'agent_id': '' if agent_id is None else agent_id,
+    }
@@ -2,17 +2,219 @@
 @Time : 2025/9/8 8:45
 @Author : black_samurai
 @File : chat_with_llm.py
-@description : AI多轮对话模块，使用LangChain实现基于ChatOpenAI的对话功能，支持记忆管理
+@description : AI多轮对话模块，使用进程内共享的 llm_client 实现对话功能，对话记忆由 conversation_store 管理，历史记录按token预算裁剪，可选缓存无历史问题的回复
 """
 
 import os
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.prompts import PromptTemplate
+import threading
+import weakref
 
+try:
+    from .conversation_store import ConversationStore
+    from .llm_client import get_llm_client, estimate_tokens
+    from .send_message import MAX_TEXT_BYTES
+except ImportError:
+    from conversation_store import ConversationStore
+    from llm_client import get_llm_client, estimate_tokens
+    from send_message import MAX_TEXT_BYTES
 
-def chat_with_llm(base_url, api_key, model_name, FromUserName, question, user_model_data):
+
+# 提示词模板
+PROMPT_TEMPLATE = """
+        system: 'You are a helpful, smart, kind, and efficient AI assistant.'
+        current conversation: {history}
+        user: {input}
+        """
+
+
+def format_history(turns):
+    """
+    把对话轮次格式化为提示词中的历史记录。
+
+    Args:
+        turns: [(问题, 回答), ...]
+
+    Returns:
+        str: 历史记录文本
+    """
+    return "\n".join(f"Human: {question}\nAI: {answer}" for question, answer in turns)
+
+
+# 每个用户一把锁，保证同一用户的对话按顺序读写记忆；不再使用的锁随引用释放自动清除
+_user_locks = weakref.WeakValueDictionary()
+_user_locks_lock = threading.Lock()
+
+
+def user_lock(user):
+    """
+    获取用户的对话锁，持有期间该用户的其他对话请求等待。
+
+    Args:
+        user: 用户标识
+
+    Returns:
+        threading.Lock: 该用户的锁
+    """
+    with _user_locks_lock:
+        lock = _user_locks.get(user)
+        if lock is None:
+            lock = _user_locks[user] = threading.Lock()
+        return lock
+
+
+def trim_history(turns, max_tokens):
+    """
+    按token预算裁剪对话历史，从最近一轮往前保留，超出预算的更早轮次丢弃。
+    最近一轮本身超出预算时截断其回答，保证至少保留最近一轮的上下文。
+
+    Args:
+        turns: [(问题, 回答), ...]，按时间先后排列
+        max_tokens: 历史记录的token预算
+
+    Returns:
+        tuple: (保留的轮次, 历史记录的token估算值)
+    """
+    kept = []
+    used = 0
+    for question, answer in reversed(turns):
+        tokens = estimate_tokens(f"Human: {question}\nAI: {answer}")
+        if used + tokens > max_tokens:
+            if not kept and max_tokens > 0:
+                # 按字符数近似截断 (多数字符不超过1个token)
+                remaining = max(max_tokens - estimate_tokens(f"Human: {question}\nAI: "), 0)
+                kept.append((question, answer[:remaining] + "…"))
+                used = estimate_tokens(format_history(kept))
+            break
+        kept.append((question, answer))
+        used += tokens
+    kept.reverse()
+    return kept, used
+
+
+def build_prompt(turns, question):
+    """
+    把用户最近的对话按 CHAT_HISTORY_TOKENS (默认1500) 的token预算裁剪后拼入提示词。
+
+    Args:
+        turns: 用户最近的对话轮次 [(问题, 回答), ...]
+        question: 用户输入的问题
+
+    Returns:
+        str: 提示词
+    """
+    kept, history_tokens = trim_history(turns, int(os.getenv("CHAT_HISTORY_TOKENS", 1500)))
+    prompt = PROMPT_TEMPLATE.format(history=format_history(kept), input=question)
+    print(f"[对话] 历史保留 {len(kept)}/{len(turns)} 轮 (约 {history_tokens} tokens), 提示词约 {estimate_tokens(prompt)} tokens")
+    return prompt
+
+
+# 句子结束符，流式回复只在这些位置切分消息
+SENTENCE_ENDS = "。！？；!?;\n"
+
+
+class StreamChunker:
+    """
+    把流式输出的文本片段拼接为适合逐条推送的消息。
+
+    - 第一条消息在第一个句子结束处发出，让用户尽快看到回复
+    - 之后在段落结束处 (且已积累 min_chars 个字符) 或积累 max_chars 个字符后的句子结束处发出
+    - 单条消息不超过 max_bytes 字节，超长时在限制内最后一个句子结束处切分，没有则直接截断
+    """
+
+    def __init__(self, min_chars=80, max_chars=400, max_bytes=MAX_TEXT_BYTES):
+        """
+        Args:
+            min_chars: 段落结束时发出消息所需的最少字符数
+            max_chars: 不等段落结束、在句子结束处即发出消息的字符数
+            max_bytes: 单条消息的UTF-8字节数上限
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self.buffer = ""
+        self.sent = 0
+
+    def feed(self, delta):
+        """
+        追加一段流式文本。
+
+        Args:
+            delta: 新增的文本片段
+
+        Returns:
+            list: 可以发出的消息
+        """
+        self.buffer += delta
+        chunks = []
+        while True:
+            cut = self._find_cut()
+            if not cut:
+                break
+            self._emit(cut, chunks)
+        return chunks
+
+    def flush(self):
+        """
+        输出结束，发出剩余的文本。
+
+        Returns:
+            list: 可以发出的消息
+        """
+        chunks = []
+        while self.buffer:
+            self._emit(self._byte_limit_cut() or len(self.buffer), chunks)
+        return chunks
+
+    def _emit(self, cut, chunks):
+        text = self.buffer[:cut].strip()
+        self.buffer = self.buffer[cut:]
+        if text:
+            chunks.append(text)
+            self.sent += 1
+
+    def _byte_limit_cut(self):
+        # 超出字节上限时返回切分位置，未超出返回0
+        if len(self.buffer.encode('utf-8')) <= self.max_bytes:
+            return 0
+        head = self.buffer.encode('utf-8')[:self.max_bytes].decode('utf-8', errors='ignore')
+        end = max(head.rfind(ch) for ch in SENTENCE_ENDS)
+        return end + 1 if end > 0 else len(head)
+
+    def _find_cut(self):
+        cut = self._byte_limit_cut()
+        if cut:
+            return cut
+        buffer = self.buffer
+        if not self.sent:
+            ends = [i for i in (buffer.find(ch) for ch in SENTENCE_ENDS) if i >= 0]
+            return min(ends) + 1 if ends else 0
+        paragraph = buffer.rfind("\n\n")
+        if paragraph >= self.min_chars:
+            return paragraph + 2
+        if len(buffer) >= self.max_chars:
+            end = max(buffer.rfind(ch) for ch in SENTENCE_ENDS)
+            if end >= self.min_chars:
+                return end + 1
+        return 0
+
+
+def lookup_cached_reply(FromUserName, question, turns, conversation_store, response_cache):
+    """
+    没有对话历史时查找回复缓存，命中后把这轮对话写入对话记忆。
+
+    Returns:
+        str | None: 缓存的回复，未命中或不可使用缓存时返回None
+    """
+    if response_cache is None or turns:
+        return None
+    message = response_cache.get(question)
+    if message is not None:
+        print(f"回复缓存命中: {question}")
+        conversation_store.append_turn(FromUserName, question, message)
+    return message
+
+
+def chat_with_llm(base_url, api_key, model_name, FromUserName, question, conversation_store, response_cache=None):
     """
     处理用户与AI的对话，支持多轮对话和记忆管理。
 
@@ -22,63 +224,103 @@ def chat_with_llm(base_url, api_key, model_name, FromUserName, question, user_mo
         model_name: AI模型名称
         FromUserName: 用户标识符，用于区分不同用户的对话
         question: 用户输入的问题
-        user_model_data: 全局用户模型数据字典
+        conversation_store: 对话记忆存储 (ConversationStore)
+        response_cache: 回复缓存 (ResponseCache)，为None时不使用缓存
 
     Returns:
         str: AI的回复内容
     """
     print("开始调用ChatGPT")
 
-    # 检查是否新用户
-    if FromUserName not in user_model_data:
-        # 初始化ChatGPT模型
-        if not api_key:
-            return "错误：API密钥未设置，请检查环境变量 AI_API_KEY"
-        if not model_name:
-            return "错误：模型名称未设置，请检查环境变量 AI_MODEL_NAME"
-
-        if api_key:
-            os.environ["OPENAI_API_KEY"] = api_key
-        if base_url:
-            os.environ["OPENAI_API_BASE"] = base_url
-
-        llm = ChatOpenAI(
-            temperature=0.7,  # 控制回复的随机性，较低值更保守
-            model=model_name,  # 从环境变量获取模型名称
-        )
-
-        # 初始化提示词模板
-        template = """
-        system: 'You are a helpful, smart, kind, and efficient AI assistant.'
-        current conversation: {history}
-        user: {input}
-        """
-        prompt = PromptTemplate(input_variables=["history", "input"], template=template)
+    if not api_key:
+        return "错误：API密钥未设置，请检查环境变量 AI_API_KEY"
+    if not model_name:
+        return "错误：模型名称未设置，请检查环境变量 AI_MODEL_NAME"
 
-        # 初始化记忆缓冲区（默认k=3，保持最近3轮对话）
-        conversation = ConversationChain(
-            llm=llm,
-            prompt=prompt,
-            memory=ConversationBufferWindowMemory(k=3),
-            verbose=True  # 启用详细输出
-        )
+    # 同一用户的对话串行处理，避免并发读写对话记忆
+    with user_lock(FromUserName):
+        # 读取该用户最近几轮对话；没有历史的问题先查回复缓存
+        turns = conversation_store.get_turns(FromUserName)
+        message = lookup_cached_reply(FromUserName, question, turns, conversation_store, response_cache)
+        if message is not None:
+            return message
+        prompt = build_prompt(turns, question)
 
-        # 将模型及记忆存储到用户数据字典
-        user_model_data[FromUserName] = conversation
+        # 输入问题并获取回复
+        try:
+            llm = get_llm_client(base_url, api_key, model_name)
+            message = llm.chat([{"role": "user", "content": prompt}], temperature=0.7)
+            print(f"AI回复: {message}")
+            conversation_store.append_turn(FromUserName, question, message)
+            if response_cache is not None and not turns:
+                response_cache.put(question, message)
+            return message
+        except Exception as e:
+            print(f"AI API调用失败: {e}")
+            return "抱歉，AI服务暂时不可用，请稍后再试。"
 
-    else:
-        # 老用户调取已存在的模型
-        conversation = user_model_data[FromUserName]
 
-    # 输入问题并获取回复
-    try:
-        message = conversation.predict(input=question)
-        print(f"AI回复: {message}")
+def chat_with_llm_stream(base_url, api_key, model_name, FromUserName, question, conversation_store, on_chunk,
+                         response_cache=None):
+    """
+    以流式方式处理用户与AI的对话，回复按句子/段落分成多条消息，每生成一条就交给 on_chunk 推送。
+    完整回复生成后才写入对话记忆。
+
+    Args:
+        base_url: AI API的基础URL
+        api_key: AI API的密钥
+        model_name: AI模型名称
+        FromUserName: 用户标识符，用于区分不同用户的对话
+        question: 用户输入的问题
+        conversation_store: 对话记忆存储 (ConversationStore)
+        on_chunk: 推送单条消息的函数，参数为消息文本
+        response_cache: 回复缓存 (ResponseCache)，为None时不使用缓存
+
+    Returns:
+        str: AI的完整回复内容
+    """
+    print("开始调用ChatGPT (流式)")
+
+    if not api_key:
+        message = "错误：API密钥未设置，请检查环境变量 AI_API_KEY"
+        on_chunk(message)
         return message
-    except Exception as e:
-        print(f"AI API调用失败: {e}")
-        return "抱歉，AI服务暂时不可用，请稍后再试。"
-    
+    if not model_name:
+        message = "错误：模型名称未设置，请检查环境变量 AI_MODEL_NAME"
+        on_chunk(message)
+        return message
+
+    with user_lock(FromUserName):
+        turns = conversation_store.get_turns(FromUserName)
+        chunker = StreamChunker()
+        message = lookup_cached_reply(FromUserName, question, turns, conversation_store, response_cache)
+        if message is not None:
+            for chunk in chunker.feed(message) + chunker.flush():
+                on_chunk(chunk)
+            return message
+        prompt = build_prompt(turns, question)
+
+        parts = []
+        try:
+            llm = get_llm_client(base_url, api_key, model_name)
+            for delta in llm.stream_chat([{"role": "user", "content": prompt}], temperature=0.7):
+                parts.append(delta)
+                for chunk in chunker.feed(delta):
+                    on_chunk(chunk)
+            for chunk in chunker.flush():
+                on_chunk(chunk)
+        except Exception as e:
+            print(f"AI API调用失败: {e}")
+            message = "抱歉，AI服务暂时不可用，请稍后再试。"
+            on_chunk(message)
+            return message
+        message = "".join(parts)
+        print(f"AI回复 (共 {chunker.sent} 条消息): {message}")
+        conversation_store.append_turn(FromUserName, question, message)
+        if response_cache is not None and not turns:
+            response_cache.put(question, message)
+        return message
+
 
 
 if __name__ == '__main__':
@@ -114,8 +356,8 @@ if __name__ == '__main__':
         model_name = os.getenv("AI_MODEL_NAME")
 
         # 调用
-        user_model_data = {}
-        content = chat_with_llm(base_url, api_key, model_name, touser, "nihao", user_model_data)
+        conversation_store = ConversationStore()
+        content = chat_with_llm(base_url, api_key, model_name, touser, "nihao", conversation_store)
     
         # 测试
         from send_message import send_message
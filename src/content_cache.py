@@ -0,0 +1,236 @@
+"""
+@Time : 2026/10/17 16:10
+@Author : black_samurai
+@File : content_cache.py
+@description : 外部内容缓存，天气、新闻、金句、金融数据按来源设置有效期，过期后先返回旧值再后台刷新，磁盘缓存供多进程共享
+"""
+
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+
+class ContentCache:
+    """
+    带有效期的内容缓存。
+
+    - 有效期内直接返回缓存 (命中)
+    - 过期但仍在 stale_ttl 宽限期内时返回旧值，并在后台刷新 (旧值命中)
+    - 超出宽限期或没有缓存时同步获取 (未命中)，同一键并发获取只请求一次
+    - 获取失败时若有旧值则返回旧值，否则抛出原异常
+    - 配置缓存目录后同时写入磁盘，不同进程共享
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        Args:
+            cache_dir: 磁盘缓存目录，为None或空字符串时只缓存在内存
+        """
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._entries = {}
+        self._stats = {}
+        # 单飞锁只在有请求持有时存在，用完随引用释放自动清除
+        self._key_locks = weakref.WeakValueDictionary()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, source, key, fetch, ttl, stale_ttl=0, cache_if=bool):
+        """
+        读取缓存，缓存不可用时调用 fetch 获取。
+
+        Args:
+            source: 内容来源，用于分类统计
+            key: 缓存键
+            fetch: 获取内容的无参函数，返回值需可JSON序列化
+            ttl: 有效期（秒）
+            stale_ttl: 过期后仍可返回旧值的宽限期（秒）
+            cache_if: 判断结果是否写入缓存的函数，默认不缓存空结果
+
+        Returns:
+            获取到的内容
+        """
+        cache_key = f"{source}:{key}"
+        entry = self._lookup(cache_key)
+        now = time.time()
+        if entry is not None:
+            age = now - entry['time']
+            if age < ttl:
+                self._count(source, 'hits')
+                return entry['value']
+            if age < ttl + stale_ttl:
+                self._count(source, 'stale_hits')
+                self._refresh_in_background(source, cache_key, fetch, cache_if)
+                return entry['value']
+
+        with self._key_lock(cache_key):
+            # 等锁期间其他线程可能已经获取完成
+            entry = self._lookup(cache_key)
+            if entry is not None and time.time() - entry['time'] < ttl:
+                self._count(source, 'hits')
+                return entry['value']
+            self._count(source, 'misses')
+            try:
+                value = fetch()
+            except Exception as e:
+                self._count(source, 'errors')
+                if entry is not None:
+                    print(f"  - {cache_key} 获取失败，使用旧缓存: {type(e).__name__}: {e}")
+                    return entry['value']
+                raise
+            if cache_if(value):
+                self._store(cache_key, value)
+            return value
+
+    def _refresh_in_background(self, source, cache_key, fetch, cache_if):
+        with self._lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def refresh():
+            try:
+                with self._key_lock(cache_key):
+                    value = fetch()
+                if cache_if(value):
+                    self._store(cache_key, value)
+            except Exception as e:
+                self._count(source, 'errors')
+                print(f"  - {cache_key} 后台刷新失败: {type(e).__name__}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(cache_key)
+
+        threading.Thread(target=refresh, name=f"cache-refresh-{source}", daemon=True).start()
+
+    def _key_lock(self, cache_key):
+        with self._lock:
+            lock = self._key_locks.get(cache_key)
+            if lock is None:
+                lock = self._key_locks[cache_key] = threading.Lock()
+            return lock
+
+    def _count(self, source, name):
+        with self._lock:
+            stat = self._stats.get(source)
+            if stat is None:
+                stat = self._stats[source] = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'errors': 0}
+            stat[name] += 1
+
+    def _path(self, cache_key):
+        file_name = hashlib.sha1(cache_key.encode()).hexdigest() + '.json'
+        return os.path.join(self.cache_dir, file_name)
+
+    def _lookup(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+        if not self.cache_dir:
+            return entry
+        # 磁盘上可能有其他进程刚写入的更新内容
+        try:
+            with open(self._path(cache_key), 'r', encoding='utf-8') as f:
+                disk_entry = json.load(f)
+        except (OSError, ValueError):
+            return entry
+        if entry is None or disk_entry.get('time', 0) > entry['time']:
+            with self._lock:
+                self._entries[cache_key] = disk_entry
+            return disk_entry
+        return entry
+
+    def _store(self, cache_key, value):
+        entry = {'time': time.time(), 'value': value}
+        with self._lock:
+            self._entries[cache_key] = entry
+        if not self.cache_dir:
+            return
+        try:
+            # 先写临时文件再替换，避免其他进程读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp_')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(cache_key))
+        except (OSError, TypeError) as e:
+            print(f"写入内容缓存失败: {e}")
+
+    def stats(self):
+        """
+        获取各来源的缓存统计。
+
+        Returns:
+            dict: 来源 -> {hits, stale_hits, misses, errors}，hits + stale_hits 即节省的外部请求数
+        """
+        with self._lock:
+            return {source: dict(stat) for source, stat in self._stats.items()}
+
+    def log_stats(self):
+        """打印各来源的缓存统计"""
+        for source, stat in self.stats().items():
+            saved = stat['hits'] + stat['stale_hits']
+            total = saved + stat['misses']
+            print(
+                f"[缓存] {source}: 命中 {stat['hits']} 次, 旧值命中 {stat['stale_hits']} 次, "
+                f"未命中 {stat['misses']} 次, 失败 {stat['errors']} 次, 节省请求 {saved}/{total}"
+            )
+
+
+# 进程内共享的缓存
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    获取进程内共享的内容缓存，首次调用时按环境变量初始化。
+    CONTENT_CACHE_DIR 为磁盘缓存目录，未配置时使用系统临时目录下的 wechat_daily_cache，配置为空时只缓存在内存。
+
+    Returns:
+        ContentCache: 内容缓存
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_dir = os.getenv("CONTENT_CACHE_DIR")
+                if cache_dir is None:
+                    cache_dir = os.path.join(tempfile.gettempdir(), "wechat_daily_cache")
+                _cache = ContentCache(cache_dir)
+    return _cache
+
+
+def cached(source, ttl, stale_ttl=0, key=None, cache_if=bool):
+    """
+    缓存装饰器，被装饰函数的返回值按参数缓存。
+
+    Args:
+        source: 内容来源，用于分类统计
+        ttl: 有效期（秒）
+        stale_ttl: 过期后仍可返回旧值的宽限期（秒）
+        key: 由函数参数生成缓存键的函数，默认使用全部位置参数
+        cache_if: 判断结果是否写入缓存的函数，默认不缓存空结果
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else ":".join(str(arg) for arg in args)
+            return get_cache().get_or_fetch(
+                source, cache_key, lambda: func(*args, **kwargs), ttl, stale_ttl=stale_ttl, cache_if=cache_if
+            )
+        return wrapper
+    return decorator
+
+
+def stats():
+    """获取共享缓存的各来源统计"""
+    return get_cache().stats()
+
+
+def log_stats():
+    """打印共享缓存的各来源统计"""
+    get_cache().log_stats()
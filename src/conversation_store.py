@@ -0,0 +1,291 @@
+"""
+@Time : 2026/10/17 17:00
+@Author : black_samurai
+@File : conversation_store.py
+@description : 多轮对话记忆存储，按用户保存最近几轮问答；内存后端支持LRU+空闲超时淘汰和内存上限，SQLite后端供多进程共享并在重启后保留
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class _Conversation:
+    """单个用户的对话记录"""
+
+    __slots__ = ('turns', 'last_active', 'size')
+
+    def __init__(self):
+        self.turns = deque()
+        self.last_active = time.monotonic()
+        self.size = 0
+
+
+def _turn_size(question, answer):
+    # 按UTF-8字节数估算占用，足以用于内存上限控制
+    return len(question.encode('utf-8')) + len(answer.encode('utf-8'))
+
+
+class ConversationStore:
+    """
+    内存中的对话记忆存储。
+
+    每个用户只保存最近 max_turns 轮 (问题, 回答) 文本，不再为每个用户保留完整的对话链对象。
+    用户按最近访问时间排列，最久未访问的在表头，因此空闲超时和LRU淘汰都只需从表头弹出。
+    """
+
+    def __init__(self, max_users=1000, idle_ttl=3600, max_turns=3, max_bytes=50 * 1024 * 1024):
+        """
+        Args:
+            max_users: 最多保留的用户数
+            idle_ttl: 用户空闲多久 (秒) 后清除其对话
+            max_turns: 每个用户保留的对话轮数
+            max_bytes: 所有对话文本的总字节数上限
+        """
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self._users = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_turns(self, user):
+        """
+        获取用户最近的对话轮次。
+
+        Args:
+            user: 用户标识
+
+        Returns:
+            list: [(问题, 回答), ...]，按时间先后排列
+        """
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            conversation = self._users.get(user)
+            if conversation is None:
+                return []
+            conversation.last_active = time.monotonic()
+            self._users.move_to_end(user)
+            return list(conversation.turns)
+
+    def append_turn(self, user, question, answer):
+        """
+        记录一轮对话。
+
+        Args:
+            user: 用户标识
+            question: 用户的问题
+            answer: AI的回答
+        """
+        size = _turn_size(question, answer)
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle(now)
+            conversation = self._users.get(user)
+            if conversation is None:
+                conversation = self._users[user] = _Conversation()
+            else:
+                self._users.move_to_end(user)
+            conversation.last_active = now
+            conversation.turns.append((question, answer))
+            conversation.size += size
+            self._total_bytes += size
+            while len(conversation.turns) > self.max_turns:
+                old_question, old_answer = conversation.turns.popleft()
+                old_size = _turn_size(old_question, old_answer)
+                conversation.size -= old_size
+                self._total_bytes -= old_size
+            # 超出用户数或内存上限时淘汰最久未访问的用户 (至少保留当前用户)
+            while len(self._users) > 1 and (len(self._users) > self.max_users or self._total_bytes > self.max_bytes):
+                self._pop_oldest()
+
+    def clear(self, user):
+        """清空单个用户的对话"""
+        with self._lock:
+            conversation = self._users.pop(user, None)
+            if conversation is not None:
+                self._total_bytes -= conversation.size
+
+    def clear_all(self):
+        """清空所有用户的对话"""
+        with self._lock:
+            self._users.clear()
+            self._total_bytes = 0
+
+    def _evict_idle(self, now):
+        while self._users:
+            oldest = next(iter(self._users.values()))
+            if now - oldest.last_active < self.idle_ttl:
+                break
+            self._pop_oldest()
+
+    def _pop_oldest(self):
+        _, conversation = self._users.popitem(last=False)
+        self._total_bytes -= conversation.size
+
+    def memory_usage(self):
+        """对话文本占用的总字节数 (估算)"""
+        with self._lock:
+            return self._total_bytes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._users)
+
+    def __contains__(self, user):
+        with self._lock:
+            return user in self._users
+
+
+class SqliteConversationStore:
+    """
+    基于SQLite (WAL模式) 的对话记忆存储，多个worker进程共享同一份对话，服务重启后不丢失。
+
+    对话按轮次追加写入日志表，按用户ID建索引，读取时只取该用户最近 max_turns 轮；
+    用户最后一轮对话超过 idle_ttl 后视为过期。定期清理过期用户和每个用户超出保留轮数的旧记录。
+    接口与 ConversationStore 相同。
+    """
+
+    # 每追加多少轮执行一次清理
+    PRUNE_INTERVAL = 200
+
+    def __init__(self, path, idle_ttl=3600, max_turns=3):
+        """
+        Args:
+            path: SQLite数据库文件路径
+            idle_ttl: 用户空闲多久 (秒) 后清除其对话
+            max_turns: 每个用户保留的对话轮数
+        """
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._appends = 0
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, created_at REAL NOT NULL, "
+            "question TEXT NOT NULL, answer TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversation_turns_user ON conversation_turns (user_id, id)")
+
+    def get_turns(self, user):
+        """
+        获取用户最近的对话轮次。
+
+        Args:
+            user: 用户标识
+
+        Returns:
+            list: [(问题, 回答), ...]，按时间先后排列
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT created_at, question, answer FROM conversation_turns "
+                "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user, self.max_turns),
+            ).fetchall()
+            if rows and time.time() - rows[0][0] >= self.idle_ttl:
+                # 空闲超时：清除该用户的全部对话，之后的新对话不会接上旧记录
+                self._conn.execute(
+                    "DELETE FROM conversation_turns WHERE user_id = ? AND created_at <= ?", (user, rows[0][0])
+                )
+                return []
+        if not rows:
+            return []
+        return [(question, answer) for _, question, answer in reversed(rows)]
+
+    def append_turn(self, user, question, answer):
+        """
+        记录一轮对话。
+
+        Args:
+            user: 用户标识
+            question: 用户的问题
+            answer: AI的回答
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conversation_turns (user_id, created_at, question, answer) VALUES (?, ?, ?, ?)",
+                (user, now, question, answer),
+            )
+            self._appends += 1
+            if self._appends % self.PRUNE_INTERVAL == 0:
+                self._prune(now)
+
+    def clear(self, user):
+        """清空单个用户的对话"""
+        with self._lock:
+            self._conn.execute("DELETE FROM conversation_turns WHERE user_id = ?", (user,))
+
+    def clear_all(self):
+        """清空所有用户的对话"""
+        with self._lock:
+            self._conn.execute("DELETE FROM conversation_turns")
+
+    def _prune(self, now):
+        try:
+            # 清理空闲超时的用户
+            self._conn.execute(
+                "DELETE FROM conversation_turns WHERE user_id IN ("
+                "SELECT user_id FROM conversation_turns GROUP BY user_id HAVING MAX(created_at) < ?)",
+                (now - self.idle_ttl,),
+            )
+            # 清理每个用户超出保留轮数的旧记录
+            self._conn.execute(
+                "DELETE FROM conversation_turns WHERE id IN ("
+                "SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS rn "
+                "FROM conversation_turns) WHERE rn > ?)",
+                (self.max_turns,),
+            )
+        except sqlite3.Error as e:
+            print(f"清理对话记录失败: {e}")
+
+    def memory_usage(self):
+        """保存的对话文本总长度 (估算)"""
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(question) + LENGTH(answer)), 0) FROM conversation_turns"
+            ).fetchone()[0]
+        return total
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT user_id) FROM conversation_turns").fetchone()[0]
+
+    def __contains__(self, user):
+        return bool(self.get_turns(user))
+
+
+def create_conversation_store():
+    """
+    根据环境变量创建对话记忆存储。
+    CHAT_MEMORY_BACKEND 为 sqlite (默认) 时使用SQLite后端，数据库路径由 CHAT_MEMORY_DB 指定，
+    未配置时为 DATA_DIR (默认项目根目录下的 data 目录) 下的 chat_memory.db；为 memory 时只保存在进程内存中。
+    用户数上限 (CHAT_MAX_USERS) 和内存上限 (CHAT_MEMORY_BUDGET_MB) 只对 memory 后端生效。
+
+    Returns:
+        ConversationStore | SqliteConversationStore: 对话记忆存储
+    """
+    idle_ttl = int(os.getenv("CHAT_IDLE_TTL", 3600))
+    max_turns = int(os.getenv("CHAT_MAX_TURNS", 3))
+    backend = os.getenv("CHAT_MEMORY_BACKEND", "sqlite").lower()
+    if backend == "sqlite":
+        path = os.getenv("CHAT_MEMORY_DB")
+        if not path:
+            data_dir = os.getenv("DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+            os.makedirs(data_dir, exist_ok=True)
+            path = os.path.join(data_dir, "chat_memory.db")
+        return SqliteConversationStore(path, idle_ttl=idle_ttl, max_turns=max_turns)
+    return ConversationStore(
+        max_users=int(os.getenv("CHAT_MAX_USERS", 1000)),
+        idle_ttl=idle_ttl,
+        max_turns=max_turns,
+        max_bytes=int(float(os.getenv("CHAT_MEMORY_BUDGET_MB", 50)) * 1024 * 1024),
+    )
@@ -5,10 +5,17 @@
 @description : 获取新浪新闻
 """
 
-import requests
 import json
 from datetime import datetime
 
+try:
+    from . import http_client
+    from .content_cache import cached
+except ImportError:
+    import http_client
+    from content_cache import cached
+
+@cached('news', ttl=600, stale_ttl=1800)
 def get_news(news_type, news_time):
     """
     获取新闻信息。
@@ -34,7 +41,7 @@ def get_news(news_type, news_time):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.71 Safari/537.36 Edg/94.0.992.38"
     }
     news_url = f'http://top.news.sina.com.cn/ws/GetTopDataList.php?top_type=day&top_cat={news_type}&top_time={news_time}&top_show_num=20&top_order=DESC&js_var=news_'
-    news_req = requests.get(url=news_url,headers=news_headers, timeout=30).text.replace("var news_ = ","").replace(r"\/\/","//").replace(";","")
+    news_req = http_client.get(url=news_url,headers=news_headers, timeout=30).text.replace("var news_ = ","").replace(r"\/\/","//").replace(";","")
     try:
         news_data = json.loads(news_req)
         news_sub = news_data.get('data', [])
@@ -0,0 +1,168 @@
+"""
+@Time : 2026/10/17 15:00
+@Author : black_samurai
+@File : http_client.py
+@description : 共享HTTP客户端，按主机复用连接池，统一超时与退避重试，并统计各主机的耗时和连接复用率
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpClient:
+    """
+    带连接池的HTTP客户端。
+
+    - 同一主机的请求复用 keep-alive 连接，不再每次重新握手
+    - 未显式传入 timeout 时使用默认超时
+    - 连接失败、429/5xx 按指数退避重试 (POST 只在连接建立失败时重试，避免重复发送消息)
+    """
+
+    def __init__(self, timeout=(5, 30), retries=2, backoff_factor=0.5, pool_maxsize=10):
+        """
+        Args:
+            timeout: 默认超时，(连接超时, 读取超时) 秒
+            retries: 最大重试次数
+            backoff_factor: 退避系数，第n次重试前等待 backoff_factor * 2^(n-1) 秒
+            pool_maxsize: 每个主机保持的最大连接数
+        """
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(pool_connections=20, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        """
+        发送HTTP请求，参数与 requests.request 相同。
+
+        Returns:
+            requests.Response: 响应对象
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).hostname or ''
+        start = time.perf_counter()
+        failed = False
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            failed = True
+            raise
+        finally:
+            self._record(host, time.perf_counter() - start, failed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, host, elapsed, failed):
+        with self._lock:
+            stat = self._stats.get(host)
+            if stat is None:
+                stat = self._stats[host] = {'requests': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0}
+            stat['requests'] += 1
+            stat['errors'] += failed
+            stat['total_time'] += elapsed
+            stat['max_time'] = max(stat['max_time'], elapsed)
+
+    def stats(self):
+        """
+        获取各主机的请求统计。
+
+        Returns:
+            dict: 主机 -> {requests, errors, avg_ms, max_ms, connections, reuse_ratio}
+                  connections 为新建连接数，reuse_ratio 为复用已有连接的请求占比
+        """
+        connections = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            conn_count, req_count = connections.get(pool.host, (0, 0))
+            connections[pool.host] = (conn_count + pool.num_connections, req_count + pool.num_requests)
+
+        result = {}
+        with self._lock:
+            for host, stat in self._stats.items():
+                conn_count, req_count = connections.get(host, (0, 0))
+                result[host] = {
+                    'requests': stat['requests'],
+                    'errors': stat['errors'],
+                    'avg_ms': round(stat['total_time'] / stat['requests'] * 1000, 1),
+                    'max_ms': round(stat['max_time'] * 1000, 1),
+                    'connections': conn_count,
+                    'reuse_ratio': round(1 - conn_count / req_count, 2) if req_count else 0.0,
+                }
+        return result
+
+    def log_stats(self):
+        """打印各主机的请求统计"""
+        for host, stat in self.stats().items():
+            print(
+                f"[HTTP] {host}: 请求 {stat['requests']} 次, 失败 {stat['errors']} 次, "
+                f"平均 {stat['avg_ms']}ms, 最长 {stat['max_ms']}ms, "
+                f"新建连接 {stat['connections']} 个, 复用率 {stat['reuse_ratio']:.0%}"
+            )
+
+
+# 进程内共享的默认客户端
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    获取进程内共享的HTTP客户端，首次调用时按环境变量初始化。
+    HTTP_TIMEOUT 为读取超时秒数，HTTP_RETRIES 为重试次数，HTTP_POOL_SIZE 为每主机连接数。
+
+    Returns:
+        HttpClient: HTTP客户端
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient(
+                    timeout=(5, float(os.getenv("HTTP_TIMEOUT", 30))),
+                    retries=int(os.getenv("HTTP_RETRIES", 2)),
+                    pool_maxsize=int(os.getenv("HTTP_POOL_SIZE", 10)),
+                )
+    return _client
+
+
+def get(url, **kwargs):
+    """使用共享客户端发送GET请求"""
+    return get_client().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """使用共享客户端发送POST请求"""
+    return get_client().post(url, **kwargs)
+
+
+def stats():
+    """获取共享客户端的各主机请求统计"""
+    return get_client().stats()
+
+
+def log_stats():
+    """打印共享客户端的各主机请求统计"""
+    get_client().log_stats()
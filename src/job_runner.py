@@ -0,0 +1,105 @@
+"""
+@Time : 2026/10/17 13:30
+@Author : black_samurai
+@File : job_runner.py
+@description : 进程内任务执行器，菜单点击触发的天气推送、邮件总结等任务在线程池中执行，按任务和用户限制并发
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Job:
+    """已注册任务的运行状态"""
+
+    __slots__ = ('name', 'func', 'max_concurrency', 'running', 'pending')
+
+    def __init__(self, name, func, max_concurrency):
+        self.name = name
+        self.func = func
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.pending = deque()
+
+
+class JobRunner:
+    """
+    进程内任务执行器。
+
+    - 同一用户的同一任务在执行或排队期间，重复提交会被忽略 (替代 /tmp/*.lock 全局锁文件)
+    - 每个任务有独立的并发上限，超出的提交进入该任务自己的等待队列，不占用线程池工作线程
+    任务与Web服务在同一进程中并发执行，任务函数不能修改进程级的全局设置
+    (如 socket.setdefaulttimeout、环境变量)，超时等设置应只作用于任务自己创建的连接。
+    """
+
+    def __init__(self, max_workers=4):
+        """
+        Args:
+            max_workers: 线程池工作线程数量
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def register(self, name, func, max_concurrency=1):
+        """
+        注册任务。
+
+        Args:
+            name: 任务名称
+            func: 任务函数，接收一个参数 touser
+            max_concurrency: 该任务同时执行的数量上限
+        """
+        self._jobs[name] = _Job(name, func, max_concurrency)
+
+    def submit(self, name, touser):
+        """
+        提交任务，立即返回。
+
+        Args:
+            name: 任务名称
+            touser: 任务目标用户
+
+        Returns:
+            bool: 成功提交返回True，该用户的同名任务已在执行或排队时返回False
+        """
+        job = self._jobs[name]
+        key = (name, touser)
+        with self._lock:
+            if key in self._active:
+                return False
+            self._active.add(key)
+            if job.running < job.max_concurrency:
+                job.running += 1
+                self.executor.submit(self._run, job, touser)
+            else:
+                job.pending.append(touser)
+                print(f"任务 {name} 已达并发上限，{touser} 进入等待队列 (排队 {len(job.pending)})")
+        return True
+
+    def _run(self, job, touser):
+        start = time.time()
+        try:
+            print(f"开始执行任务 {job.name} ({touser})")
+            job.func(touser)
+            print(f"任务 {job.name} ({touser}) 执行完成，耗时 {time.time() - start:.2f} 秒")
+        except Exception as e:
+            print(f"任务 {job.name} ({touser}) 执行失败: {e}")
+        finally:
+            with self._lock:
+                self._active.discard((job.name, touser))
+                if job.pending:
+                    # 名额直接交给排队中的下一个用户
+                    next_user = job.pending.popleft()
+                    try:
+                        self.executor.submit(self._run, job, next_user)
+                    except RuntimeError:
+                        # 线程池已关闭，放弃排队中的任务
+                        print(f"执行器已关闭，放弃排队任务 {job.name} ({next_user})")
+                        self._active.discard((job.name, next_user))
+                        job.running -= 1
+                else:
+                    job.running -= 1
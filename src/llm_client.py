@@ -0,0 +1,250 @@
+"""
+@Time : 2026/10/17 18:30
+@Author : black_samurai
+@File : llm_client.py
+@description : 进程内共享的大模型客户端，复用HTTP连接池，限制并发调用数，并记录每次调用的耗时和token用量
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+import httpx
+from openai import OpenAI
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 中日韩文字及全角符号，每个字符大约对应一个token
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+# tiktoken cl100k_base 词表的下载地址，本地缓存文件以其SHA1命名
+TIKTOKEN_VOCAB_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _tiktoken_vocab_cached():
+    # 与 tiktoken 的缓存目录规则一致：TIKTOKEN_CACHE_DIR > DATA_GYM_CACHE_DIR > 系统临时目录/data-gym-cache
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR", os.environ.get("DATA_GYM_CACHE_DIR"))
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        return False
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(TIKTOKEN_VOCAB_URL.encode()).hexdigest()))
+
+
+def _get_encoding():
+    # 只在词表已缓存在本地，或配置 TIKTOKEN_DOWNLOAD 允许下载时使用 tiktoken，
+    # 避免首次对话在持锁状态下等待网络下载；加载失败后不再重试，改用字符估算
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = False
+                allow_download = os.getenv("TIKTOKEN_DOWNLOAD", "false").lower() in ("1", "true", "yes")
+                if tiktoken is not None and (allow_download or _tiktoken_vocab_cached()):
+                    try:
+                        _encoding = tiktoken.get_encoding("cl100k_base")
+                    except Exception as e:
+                        print(f"加载tiktoken词表失败，改用字符估算token数: {e}")
+    return _encoding or None
+
+
+def estimate_tokens(text):
+    """
+    估算文本的token数。优先使用 tiktoken (cl100k_base)，不可用时按字符估算：
+    中日韩字符每个约1个token，其余字符每4个约1个token。
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: token数估算值
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class LLMClient:
+    """
+    线程安全的大模型客户端 (OpenAI兼容接口)。
+
+    - 所有调用共用一个 httpx 连接池，不再每个用户/每次调用重新建立TLS连接
+    - 同时进行的调用数不超过 max_concurrency，超出的调用排队等待
+    """
+
+    def __init__(self, api_key, base_url=None, model_name=None, max_concurrency=8, timeout=120, max_connections=20):
+        """
+        Args:
+            api_key: AI API的密钥
+            base_url: AI API的基础URL
+            model_name: 默认模型名称
+            max_concurrency: 同时进行的调用数上限
+            timeout: 单次调用超时（秒）
+            max_connections: 连接池最大连接数
+        """
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+        self.client = OpenAI(api_key=api_key, base_url=base_url or None, timeout=timeout, http_client=http_client)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._stats = {'calls': 0, 'errors': 0, 'total_time': 0.0, 'wait_time': 0.0,
+                       'prompt_tokens': 0, 'completion_tokens': 0}
+        self._lock = threading.Lock()
+
+    def chat(self, messages, model=None, **kwargs):
+        """
+        调用对话补全接口。
+
+        Args:
+            messages: 消息列表，如 [{"role": "user", "content": "..."}]
+            model: 模型名称，默认使用初始化时的模型
+            **kwargs: 透传给 chat.completions.create 的参数，如 temperature、timeout
+
+        Returns:
+            str: 模型回复内容
+        """
+        return self.chat_with_usage(messages, model=model, **kwargs)[0]
+
+    def chat_with_usage(self, messages, model=None, **kwargs):
+        """
+        调用对话补全接口，同时返回token用量。
+
+        Args:
+            messages: 消息列表
+            model: 模型名称，默认使用初始化时的模型
+            **kwargs: 透传给 chat.completions.create 的参数
+
+        Returns:
+            tuple: (模型回复内容, usage)，接口未返回用量时 usage 为None
+        """
+        queued_at = time.perf_counter()
+        with self._semaphore:
+            start = time.perf_counter()
+            wait_time = start - queued_at
+            try:
+                response = self.client.chat.completions.create(
+                    model=model or self.model_name, messages=messages, stream=False, **kwargs
+                )
+            except Exception:
+                self._record(time.perf_counter() - start, wait_time, None, failed=True)
+                raise
+        elapsed = time.perf_counter() - start
+        self._record(elapsed, wait_time, response.usage)
+        usage = response.usage
+        print(
+            f"[LLM] 调用耗时 {elapsed:.2f} 秒 (排队 {wait_time:.2f} 秒)"
+            + (f", prompt {usage.prompt_tokens} tokens, 回复 {usage.completion_tokens} tokens" if usage else "")
+        )
+        return response.choices[0].message.content, usage
+
+    def stream_chat(self, messages, model=None, **kwargs):
+        """
+        以流式方式调用对话补全接口，逐段产出回复文本。
+        流式调用在整个输出期间占用一个并发名额。
+
+        Args:
+            messages: 消息列表
+            model: 模型名称，默认使用初始化时的模型
+            **kwargs: 透传给 chat.completions.create 的参数
+
+        Yields:
+            str: 新增的回复文本片段
+        """
+        queued_at = time.perf_counter()
+        with self._semaphore:
+            start = time.perf_counter()
+            wait_time = start - queued_at
+            first_token_time = None
+            try:
+                stream = self.client.chat.completions.create(
+                    model=model or self.model_name, messages=messages, stream=True, **kwargs
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter() - start
+                        yield delta
+            except Exception:
+                self._record(time.perf_counter() - start, wait_time, None, failed=True)
+                raise
+        elapsed = time.perf_counter() - start
+        self._record(elapsed, wait_time, None)
+        print(
+            f"[LLM] 流式调用耗时 {elapsed:.2f} 秒 (排队 {wait_time:.2f} 秒)"
+            + (f", 首段文本 {first_token_time:.2f} 秒" if first_token_time is not None else "")
+        )
+
+    def _record(self, elapsed, wait_time, usage, failed=False):
+        with self._lock:
+            stats = self._stats
+            stats['calls'] += 1
+            stats['errors'] += failed
+            stats['total_time'] += elapsed
+            stats['wait_time'] += wait_time
+            if usage:
+                stats['prompt_tokens'] += usage.prompt_tokens or 0
+                stats['completion_tokens'] += usage.completion_tokens or 0
+
+    def stats(self):
+        """
+        获取调用统计。
+
+        Returns:
+            dict: {calls, errors, total_time, wait_time, prompt_tokens, completion_tokens}
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+# 进程内共享的客户端，按 (base_url, api_key, model_name) 区分
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(base_url=None, api_key=None, model_name=None):
+    """
+    获取进程内共享的大模型客户端，同一配置只创建一次。
+    参数为空时读取环境变量 AI_BASE_URL、AI_API_KEY、AI_MODEL_NAME；
+    并发上限和超时分别由 AI_MAX_CONCURRENCY、AI_TIMEOUT 配置。
+
+    Args:
+        base_url: AI API的基础URL
+        api_key: AI API的密钥
+        model_name: AI模型名称
+
+    Returns:
+        LLMClient: 大模型客户端
+    """
+    base_url = base_url or os.getenv("AI_BASE_URL")
+    api_key = api_key or os.getenv("AI_API_KEY")
+    model_name = model_name or os.getenv("AI_MODEL_NAME")
+    key = (base_url, api_key, model_name)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = LLMClient(
+                api_key, base_url, model_name,
+                max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", 8)),
+                timeout=float(os.getenv("AI_TIMEOUT", 120)),
+            )
+            _clients[key] = client
+        return client
@@ -0,0 +1,199 @@
+"""
+@Time : 2026/10/17 22:10
+@Author : black_samurai
+@File : mail_cache.py
+@description : 邮件增量同步状态与本地邮件缓存，按账号记录UIDVALIDITY和已同步的最大UID，已解析的邮件按UID缓存，重复运行只获取新邮件
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+# 增量同步检查点：服务器邮箱的UIDVALIDITY、已同步的最大UID、已同步覆盖的最早日期
+SyncState = namedtuple('SyncState', ['uidvalidity', 'last_uid', 'synced_since'])
+
+
+class MailCache:
+    """
+    基于SQLite (WAL模式) 的邮件缓存，多个进程共享，重启后保留。
+
+    - mailbox_state 按账号保存增量同步检查点，UIDVALIDITY 变化时该账号的缓存全部作废
+    - mail_messages 按 (账号, UID) 保存邮件的本地日期、发件人地址和解析后的内容；只复核过标头、尚未下载正文的邮件内容为空
+    - 超过 keep_days 天的邮件定期清理
+    """
+
+    def __init__(self, path, keep_days=7):
+        """
+        Args:
+            path: SQLite数据库文件路径
+            keep_days: 邮件缓存保留天数
+        """
+        self.path = path
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mailbox_state ("
+            "account TEXT PRIMARY KEY, uidvalidity INTEGER NOT NULL, last_uid INTEGER NOT NULL, "
+            "synced_since TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mail_messages ("
+            "account TEXT NOT NULL, uid INTEGER NOT NULL, email_date TEXT NOT NULL, data TEXT, sender TEXT, "
+            "PRIMARY KEY (account, uid))"
+        )
+        # 旧版本创建的表没有 sender 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(mail_messages)")}
+        if 'sender' not in columns:
+            self._conn.execute("ALTER TABLE mail_messages ADD COLUMN sender TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_mail_messages_date ON mail_messages (account, email_date)")
+
+    def get_state(self, account):
+        """
+        读取账号的同步检查点。
+
+        Args:
+            account: 账号标识
+
+        Returns:
+            SyncState | None: 检查点，没有时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uidvalidity, last_uid, synced_since FROM mailbox_state WHERE account = ?", (account,)
+            ).fetchone()
+        if row is None:
+            return None
+        return SyncState(row[0], row[1], date.fromisoformat(row[2]))
+
+    def save_state(self, account, state):
+        """
+        保存账号的同步检查点，并清理过期的邮件缓存。
+
+        Args:
+            account: 账号标识
+            state: SyncState
+        """
+        # 早于保留期的邮件会被清理，检查点覆盖的最早日期不能早于保留期
+        keep_since = date.today() - timedelta(days=self.keep_days)
+        synced_since = max(state.synced_since, keep_since)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO mailbox_state (account, uidvalidity, last_uid, synced_since, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (account, state.uidvalidity, state.last_uid, synced_since.isoformat(), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM mail_messages WHERE account = ? AND email_date < ?",
+                (account, keep_since.isoformat()),
+            )
+
+    def reset(self, account):
+        """清除账号的检查点和邮件缓存 (如UIDVALIDITY变化)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM mailbox_state WHERE account = ?", (account,))
+            self._conn.execute("DELETE FROM mail_messages WHERE account = ?", (account,))
+
+    def known_dates(self, account, uids):
+        """
+        查询已复核过标头的邮件。
+
+        Args:
+            account: 账号标识
+            uids: UID列表
+
+        Returns:
+            dict: UID -> 本地日期
+        """
+        result = {}
+        uids = [int(uid) for uid in uids]
+        with self._lock:
+            # 分批查询，避免超出SQLite的参数个数上限
+            for i in range(0, len(uids), 500):
+                chunk = uids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT uid, email_date FROM mail_messages WHERE account = ? AND uid IN ({','.join('?' * len(chunk))})",
+                    (account, *chunk),
+                ).fetchall()
+                result.update((uid, date.fromisoformat(email_date)) for uid, email_date in rows)
+        return result
+
+    def save_headers(self, account, headers):
+        """
+        记录邮件的本地日期和发件人地址，已有记录保持不变。
+
+        Args:
+            account: 账号标识
+            headers: UID -> (本地日期, 发件人地址)
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO mail_messages (account, uid, email_date, sender) VALUES (?, ?, ?, ?)",
+                [(account, uid, email_date.isoformat(), sender) for uid, (email_date, sender) in headers.items()],
+            )
+
+    def messages_between(self, account, start_date, end_date):
+        """
+        读取日期范围内的缓存邮件。
+
+        Args:
+            account: 账号标识
+            start_date: 开始日期
+            end_date: 结束日期
+
+        Returns:
+            dict: UID -> (发件人地址, 解析后的邮件 dict)，发件人未知或尚未下载正文的为None
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT uid, sender, data FROM mail_messages WHERE account = ? AND email_date BETWEEN ? AND ?",
+                (account, start_date.isoformat(), end_date.isoformat()),
+            ).fetchall()
+        return {uid: (sender, json.loads(data) if data else None) for uid, sender, data in rows}
+
+    def save_message(self, account, uid, email_date, data):
+        """
+        缓存解析后的邮件。
+
+        Args:
+            account: 账号标识
+            uid: 邮件UID
+            email_date: 本地日期
+            data: 解析后的邮件 (可JSON序列化的dict)
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO mail_messages (account, uid, email_date, sender, data) VALUES (?, ?, ?, ?, ?)",
+                (account, int(uid), email_date.isoformat(), data.get('sender'), json.dumps(data, ensure_ascii=False)),
+            )
+
+
+# 进程内共享的邮件缓存
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_mail_cache():
+    """
+    获取进程内共享的邮件缓存，首次调用时按环境变量初始化。
+    缓存默认关闭，配置 EMAIL_CACHE_DB (数据库路径) 后开启；缓存中保存明文的发件人和邮件正文，
+    EMAIL_CACHE_DAYS 为保留天数，超出的邮件在下次同步时删除。
+
+    Returns:
+        MailCache | None: 邮件缓存，未启用时返回None
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = os.getenv("EMAIL_CACHE_DB")
+                if path and os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                _cache = MailCache(path, keep_days=int(os.getenv("EMAIL_CACHE_DAYS", 7))) if path else False
+    return _cache or None
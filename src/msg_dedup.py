@@ -0,0 +1,162 @@
+"""
+@Time : 2026/10/17 10:15
+@Author : black_samurai
+@File : msg_dedup.py
+@description : 回调消息去重模块，按时间和数量双重限制，支持SQLite持久化以便跨进程、跨重启共享
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def event_dedup_key(from_user, create_time, event, event_key):
+    """
+    生成事件消息的去重键。事件回调没有MsgId，企业微信建议使用 FromUserName + CreateTime 排重。
+
+    Args:
+        from_user: 触发事件的用户
+        create_time: 消息创建时间
+        event: 事件类型
+        event_key: 事件KEY值
+
+    Returns:
+        str: 去重键
+    """
+    return f"event#{from_user}#{create_time}#{event}#{event_key}"
+
+
+class MsgDedup:
+    """
+    内存去重表。
+
+    键按插入顺序存放在 OrderedDict 中，过期时间单调递增，
+    因此过期淘汰只需从表头弹出，插入、查询、淘汰均为O(1)。
+    """
+
+    def __init__(self, max_size=10000, ttl=600):
+        """
+        Args:
+            max_size: 最多保留的消息数
+            ttl: 消息保留时长（秒），企业微信重试窗口远小于默认值
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_and_add(self, key):
+        """
+        检查消息是否首次出现，首次出现时记录下来。
+
+        Args:
+            key: 消息去重键（MsgId 或事件去重键）
+
+        Returns:
+            bool: 首次出现返回True，重复消息返回False
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            if key in self._items:
+                return False
+            self._items[key] = now + self.ttl
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return True
+
+    def _evict(self, now):
+        items = self._items
+        while items:
+            oldest_key = next(iter(items))
+            if items[oldest_key] > now:
+                break
+            items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SqliteMsgDedup:
+    """
+    基于SQLite的去重表，多个gunicorn worker或服务重启后共享同一份去重记录。
+    """
+
+    # 每插入多少条执行一次过期清理
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path, max_size=10000, ttl=600):
+        """
+        Args:
+            path: SQLite数据库文件路径
+            max_size: 最多保留的消息数
+            ttl: 消息保留时长（秒）
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS msg_dedup (key TEXT PRIMARY KEY, expire_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_msg_dedup_expire ON msg_dedup (expire_at)")
+
+    def check_and_add(self, key):
+        """
+        检查消息是否首次出现，首次出现时记录下来。
+
+        Args:
+            key: 消息去重键（MsgId 或事件去重键）
+
+        Returns:
+            bool: 首次出现返回True，重复消息返回False
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                # 已过期的同名记录视为不存在
+                self._conn.execute("DELETE FROM msg_dedup WHERE key = ? AND expire_at <= ?", (key, now))
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO msg_dedup (key, expire_at) VALUES (?, ?)", (key, now + self.ttl)
+                )
+                is_new = cur.rowcount == 1
+                if is_new:
+                    self._inserts += 1
+                    if self._inserts % self.PRUNE_INTERVAL == 0:
+                        self._prune(now)
+                return is_new
+            except sqlite3.Error as e:
+                # 去重失败时宁可重复处理，也不丢消息
+                print(f"消息去重表访问失败: {e}")
+                return True
+
+    def _prune(self, now):
+        self._conn.execute("DELETE FROM msg_dedup WHERE expire_at <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM msg_dedup WHERE key IN ("
+            "SELECT key FROM msg_dedup ORDER BY expire_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM msg_dedup").fetchone()[0]
+
+
+def create_msg_dedup():
+    """
+    根据环境变量创建去重表。配置了 MSG_DEDUP_DB 时使用SQLite持久化，否则使用内存去重表。
+
+    Returns:
+        MsgDedup | SqliteMsgDedup: 去重表实例
+    """
+    max_size = int(os.getenv("MSG_DEDUP_MAX_SIZE", 10000))
+    ttl = int(os.getenv("MSG_DEDUP_TTL", 600))
+    db_path = os.getenv("MSG_DEDUP_DB")
+    if db_path:
+        return SqliteMsgDedup(db_path, max_size=max_size, ttl=ttl)
+    return MsgDedup(max_size=max_size, ttl=ttl)
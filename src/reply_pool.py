@@ -0,0 +1,147 @@
+"""
+@Time : 2026/10/17 9:30
+@Author : black_samurai
+@File : reply_pool.py
+@description : 异步回复线程池，回调立即应答，AI回复在后台生成后通过主动消息接口推送
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .send_message import send_message
+except ImportError:
+    from send_message import send_message
+
+
+class _UserQueue:
+    """单个用户待处理的消息"""
+
+    __slots__ = ('texts', 'func', 'stream', 'running', 'timer')
+
+    def __init__(self):
+        self.texts = []
+        self.func = None
+        self.stream = False
+        self.running = False
+        self.timer = None
+
+
+class ReplyPool:
+    """
+    后台回复线程池。
+
+    企业微信回调要求5秒内响应，AI对话往往超时并触发重试。
+    开启异步模式后回调直接应答，对话任务交给线程池执行，结果通过 send_message 主动推送。
+
+    submit_message 按用户排队：同一用户在 debounce 秒内连续发送的消息合并为一轮对话，
+    上一轮回复生成期间收到的消息在其结束后合并处理，同一用户同时最多只有一轮对话在进行。
+    """
+
+    def __init__(self, wxid, wxsecret, agentid, max_workers=8, debounce=1.0):
+        """
+        Args:
+            wxid: 企业微信CorpID
+            wxsecret: 企业微信应用Secret
+            agentid: 企业微信应用AgentID
+            max_workers: 后台线程数量，即同时进行的对话数上限
+            debounce: 合并连续消息的等待时间（秒），为0时不等待，但仍按用户串行处理
+        """
+        self.wxid = wxid
+        self.wxsecret = wxsecret
+        self.agentid = agentid
+        self.debounce = debounce
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reply")
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit_message(self, touser, text, func, stream=False):
+        """
+        提交用户的一条消息，与同一用户的连续消息合并后交给 func 生成回复。
+
+        Args:
+            touser: 发送消息的用户，回复推送给该用户
+            text: 消息内容
+            func: 生成回复的函数，参数为合并后的消息文本；stream 为True时还会传入 on_chunk 参数
+            stream: 是否以流式方式推送回复
+        """
+        with self._lock:
+            queue = self._queues.get(touser)
+            if queue is None:
+                queue = self._queues[touser] = _UserQueue()
+            queue.texts.append(text)
+            queue.func = func
+            queue.stream = stream
+            if queue.running:
+                # 当前一轮结束后再合并处理
+                return
+            if queue.timer is not None:
+                queue.timer.cancel()
+                queue.timer = None
+            if self.debounce > 0:
+                queue.timer = threading.Timer(self.debounce, self._dispatch, (touser,))
+                queue.timer.daemon = True
+                queue.timer.start()
+                return
+        self._dispatch(touser)
+
+    def _dispatch(self, touser):
+        with self._lock:
+            queue = self._queues.get(touser)
+            if queue is None or queue.running or not queue.texts:
+                return
+            texts, queue.texts = queue.texts, []
+            queue.running = True
+            queue.timer = None
+            func, stream = queue.func, queue.stream
+        if len(texts) > 1:
+            print(f"合并 {touser} 的 {len(texts)} 条连续消息")
+        question = "\n".join(texts)
+        try:
+            if stream:
+                self.executor.submit(self._run_turn, touser, self._run_stream, touser, func, question)
+            else:
+                self.executor.submit(self._run_turn, touser, self._run, touser, func, question)
+        except RuntimeError:
+            # 线程池已关闭
+            with self._lock:
+                self._queues.pop(touser, None)
+
+    def _run_turn(self, touser, runner, *args):
+        try:
+            return runner(*args)
+        finally:
+            with self._lock:
+                queue = self._queues[touser]
+                queue.running = False
+                pending = bool(queue.texts)
+                if not pending:
+                    del self._queues[touser]
+            if pending:
+                self._dispatch(touser)
+
+    def _run_stream(self, touser, func, *args, **kwargs):
+        def on_chunk(text):
+            print(f"流式推送给 {touser}: {text}")
+            send_message(self.wxid, self.wxsecret, self.agentid, touser, text)
+
+        try:
+            return func(*args, on_chunk=on_chunk, **kwargs)
+        except Exception as e:
+            print(f"后台回复任务异常: {e}")
+            on_chunk("抱歉，AI服务暂时不可用，请稍后再试。")
+
+    def _run(self, touser, func, *args, **kwargs):
+        try:
+            content = func(*args, **kwargs)
+        except Exception as e:
+            print(f"后台回复任务异常: {e}")
+            content = "抱歉，AI服务暂时不可用，请稍后再试。"
+        if content:
+            print(f"异步推送给 {touser}: {content}")
+            send_message(self.wxid, self.wxsecret, self.agentid, touser, content)
+        return content
+
+    def shutdown(self, wait=True):
+        """关闭线程池"""
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,248 @@
+"""
+@Time : 2026/10/17 20:10
+@Author : black_samurai
+@File : response_cache.py
+@description : AI对话回复缓存，没有对话历史的常见问题直接返回缓存回复，支持按字符二元组相似度匹配，SQLite存储在重启后保留
+"""
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+# 问题首尾可忽略的空白和标点 (NFKC 归一化后全角标点已转为半角)
+TRIM_CHARS = " ?!.,~。，、！？…"
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_question(question):
+    """
+    归一化问题文本：全角转半角、英文转小写、合并空白、去掉首尾标点。
+
+    Args:
+        question: 用户输入的问题
+
+    Returns:
+        str: 归一化后的问题
+    """
+    text = unicodedata.normalize('NFKC', question).lower()
+    return WHITESPACE_PATTERN.sub(' ', text).strip(TRIM_CHARS)
+
+
+def bigram_vector(text):
+    """
+    计算文本的字符二元组频次向量，单个字符的文本使用该字符本身。
+
+    Args:
+        text: 归一化后的文本
+
+    Returns:
+        tuple: (Counter, 向量模长)
+    """
+    grams = Counter(text[i:i + 2] for i in range(len(text) - 1)) if len(text) > 1 else Counter(text)
+    return grams, math.sqrt(sum(count * count for count in grams.values()))
+
+
+def cosine_similarity(a, b):
+    """计算两个 bigram_vector 结果的余弦相似度"""
+    grams_a, norm_a = a
+    grams_b, norm_b = b
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(grams_a) > len(grams_b):
+        grams_a, grams_b = grams_b, grams_a
+    dot = sum(count * grams_b.get(gram, 0) for gram, count in grams_a.items())
+    return dot / (norm_a * norm_b)
+
+
+class ResponseCache:
+    """
+    基于SQLite (WAL模式) 的对话回复缓存，多个worker进程共享，服务重启后不丢失。
+
+    - 以归一化后的问题为键精确匹配
+    - similarity 大于0时，精确匹配失败后与缓存中的问题按字符二元组余弦相似度匹配，达到阈值即命中
+    - 缓存超过 ttl 后失效，条目数超过 max_entries 时淘汰最早写入的
+    只用于没有对话历史的问题，有历史时回复依赖上下文，不应复用。
+    """
+
+    # 每写入多少条执行一次清理
+    PRUNE_INTERVAL = 50
+    # 每查找多少次打印一次命中率统计
+    LOG_INTERVAL = 100
+
+    def __init__(self, path, ttl=3600, max_entries=1000, similarity=0):
+        """
+        Args:
+            path: SQLite数据库文件路径
+            ttl: 缓存有效期（秒）
+            max_entries: 最多缓存的回复条数
+            similarity: 相似问题匹配阈值 (0~1)，为0时只做精确匹配
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._vectors = {}
+        self._stats = {'hits': 0, 'similar_hits': 0, 'misses': 0}
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, "
+            "created_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache (created_at)")
+
+    @staticmethod
+    def _key(normalized):
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, question):
+        """
+        查找问题的缓存回复。
+
+        Args:
+            question: 用户输入的问题
+
+        Returns:
+            str | None: 缓存的回复，未命中时返回None
+        """
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        key = self._key(normalized)
+        expire_before = time.time() - self.ttl
+        answer = None
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT answer FROM response_cache WHERE key = ? AND created_at >= ?", (key, expire_before)
+                ).fetchone()
+                if row is not None:
+                    answer = self._hit(key, row[0], 'hits')
+                elif self.similarity > 0:
+                    match = self._find_similar(normalized, expire_before)
+                    if match is not None:
+                        answer = self._hit(match[0], match[1], 'similar_hits')
+                if answer is None:
+                    self._stats['misses'] += 1
+                lookups = self._stats['hits'] + self._stats['similar_hits'] + self._stats['misses']
+        except sqlite3.Error as e:
+            print(f"回复缓存访问失败: {e}")
+            return None
+        if lookups % self.LOG_INTERVAL == 0:
+            self.log_stats()
+        return answer
+
+    def _hit(self, key, answer, name):
+        self._conn.execute("UPDATE response_cache SET hits = hits + 1 WHERE key = ?", (key,))
+        self._stats[name] += 1
+        return answer
+
+    def _find_similar(self, normalized, expire_before):
+        target = bigram_vector(normalized)
+        best = None
+        best_score = self.similarity
+        rows = self._conn.execute(
+            "SELECT key, question, answer FROM response_cache WHERE created_at >= ?", (expire_before,)
+        ).fetchall()
+        vectors = {}
+        for key, question, answer in rows:
+            # 缓存已计算过的向量，缓存条目变化时只计算新增的
+            vector = self._vectors.get(key) or bigram_vector(question)
+            vectors[key] = vector
+            score = cosine_similarity(target, vector)
+            if score >= best_score:
+                best, best_score = (key, answer), score
+        self._vectors = vectors
+        return best
+
+    def put(self, question, answer):
+        """
+        缓存问题的回复。
+
+        Args:
+            question: 用户输入的问题
+            answer: AI的回复
+        """
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                    (self._key(normalized), normalized, answer, now),
+                )
+                self._puts += 1
+                if self._puts % self.PRUNE_INTERVAL == 0:
+                    self._prune(now)
+        except sqlite3.Error as e:
+            print(f"回复缓存写入失败: {e}")
+
+    def _prune(self, now):
+        self._conn.execute("DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            "SELECT key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        """清空所有缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._vectors = {}
+
+    def stats(self):
+        """
+        获取本进程的缓存统计。
+
+        Returns:
+            dict: {hits, similar_hits, misses, hit_rate}
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats['hits'] + stats['similar_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['similar_hits']) / total if total else 0.0
+        return stats
+
+    def log_stats(self):
+        """打印缓存统计"""
+        stats = self.stats()
+        print(
+            f"[回复缓存] 命中 {stats['hits']} 次, 相似命中 {stats['similar_hits']} 次, "
+            f"未命中 {stats['misses']} 次, 命中率 {stats['hit_rate']:.1%}"
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+def create_response_cache():
+    """
+    根据环境变量创建回复缓存。CHAT_RESPONSE_CACHE 未开启时返回None。
+    数据库路径由 CHAT_RESPONSE_CACHE_DB 指定，默认为项目根目录下的 response_cache.db。
+
+    Returns:
+        ResponseCache | None: 回复缓存
+    """
+    if os.getenv("CHAT_RESPONSE_CACHE", "false").lower() not in ("1", "true", "yes"):
+        return None
+    default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "response_cache.db")
+    return ResponseCache(
+        os.getenv("CHAT_RESPONSE_CACHE_DB") or default_path,
+        ttl=int(os.getenv("CHAT_RESPONSE_CACHE_TTL", 3600)),
+        max_entries=int(os.getenv("CHAT_RESPONSE_CACHE_MAX", 1000)),
+        similarity=float(os.getenv("CHAT_RESPONSE_CACHE_SIMILARITY", 0)),
+    )
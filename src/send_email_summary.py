@@ -12,13 +12,32 @@ import socket
 import re
 import sys
 import json
+import base64
+import binascii
+import quopri
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from email.header import decode_header
 from email.utils import parsedate_to_datetime, parseaddr
 from email.policy import default as email_policy
+from html.parser import HTMLParser
 from datetime import datetime, timedelta
 import requests
-from bs4 import BeautifulSoup
-from openai import OpenAI
+
+try:
+    from .llm_client import get_llm_client, estimate_tokens
+    from .mail_cache import SyncState, get_mail_cache
+    from .sender_blacklist import compile_blacklist
+    from .send_message import send_message, RateLimiter
+    from . import http_client
+except ImportError:
+    from llm_client import get_llm_client, estimate_tokens
+    from mail_cache import SyncState, get_mail_cache
+    from sender_blacklist import compile_blacklist
+    from send_message import send_message, RateLimiter
+    import http_client
 
 
 # --- 辅助函数 ---
@@ -55,6 +74,289 @@ def safe_id_str(n):
     """
     return n.decode() if isinstance(n, bytes) else str(n)
 
+# IMAP 日期格式中的月份缩写，不能依赖 strftime('%b')，它随系统区域设置变化
+IMAP_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+def format_imap_date(day):
+    """
+    把日期格式化为IMAP SEARCH使用的格式，如 17-Oct-2026。
+
+    Args:
+        day: datetime.date 对象
+
+    Returns:
+        str: IMAP日期字符串
+    """
+    return f"{day.day:02d}-{IMAP_MONTHS[day.month - 1]}-{day.year}"
+
+def email_local_date(date_str):
+    """
+    解析邮件Date标头，返回本地时区下的日期。
+
+    Args:
+        date_str: Date标头内容
+
+    Returns:
+        datetime.date: 本地日期
+    """
+    email_datetime = parsedate_to_datetime(date_str)
+    if email_datetime.tzinfo is not None:
+        email_datetime = email_datetime.astimezone()
+    return email_datetime.date()
+
+# 批量FETCH时每条命令包含的邮件数：标头很小可以多取，正文按块取以限制内存占用
+HEADER_FETCH_CHUNK = 200
+BODY_FETCH_CHUNK = 50
+# IMAP连接和读写超时（秒）
+IMAP_TIMEOUT = 60
+
+# FETCH 响应解析：一封邮件的响应以 "序号 (" 开头，字面量前是数据项名称
+FETCH_START_PATTERN = re.compile(rb'^\d+ \(')
+FETCH_UID_PATTERN = re.compile(rb'UID (\d+)')
+FETCH_ITEM_PATTERN = re.compile(rb'(BODY\[[^\]]*\](?:<\d+>)?|RFC822(?:\.HEADER|\.TEXT)?) \{\d+\}$')
+
+def format_uid_set(uids):
+    """
+    把UID列表压缩为IMAP消息集合，连续的UID合并为区间，如 101:150,152。
+
+    Args:
+        uids: UID列表 (bytes、str或int)
+
+    Returns:
+        str: 消息集合字符串
+    """
+    numbers = sorted({int(uid) for uid in uids})
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(str(start) if start == end else f"{start}:{end}" for start, end in ranges)
+
+def parse_fetch_response(data):
+    """
+    逐封解析 UID FETCH 的响应。
+    BODYSTRUCTURE 解析为嵌套列表，键为 'BODYSTRUCTURE'。
+
+    Args:
+        data: imaplib 返回的响应数据列表
+
+    Yields:
+        tuple: (UID, {数据项名称: 内容字节})
+    """
+    uid = None
+    items = None
+    text = []
+    for part in data:
+        head, literal = part if isinstance(part, tuple) else (part, None)
+        if not head:
+            continue
+        if FETCH_START_PATTERN.match(head):
+            if items is not None and uid is not None:
+                yield uid, _with_body_structure(items, text)
+            uid = None
+            items = {}
+            text = []
+        if items is None:
+            continue
+        match = FETCH_UID_PATTERN.search(head)
+        if match:
+            uid = int(match.group(1))
+        if literal is None:
+            text.append(head)
+            continue
+        match = FETCH_ITEM_PATTERN.search(head)
+        if match:
+            items[match.group(1).decode().upper()] = literal
+            text.append(head)
+        else:
+            # BODYSTRUCTURE 中以字面量形式返回的字符串 (如长文件名)，按带引号的字符串拼回
+            text.append(head[:head.rfind(b'{')] + b'"' + literal.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"')
+    if items is not None and uid is not None:
+        yield uid, _with_body_structure(items, text)
+
+def _with_body_structure(items, text):
+    joined = b''.join(text).decode('utf-8', errors='replace')
+    index = joined.find('BODYSTRUCTURE (')
+    if index >= 0:
+        items['BODYSTRUCTURE'] = parse_imap_list(joined, index + len('BODYSTRUCTURE '))
+    return items
+
+# IMAP括号列表的词法单元：括号、带引号的字符串、其他原子 (数字、NIL等)
+IMAP_TOKEN_PATTERN = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+IMAP_ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+def parse_imap_list(text, start=0):
+    """
+    解析IMAP响应中的括号列表 (如 BODYSTRUCTURE)。
+
+    Args:
+        text: 响应文本
+        start: 列表左括号的位置
+
+    Returns:
+        list | None: 嵌套列表，字符串保持原样，NIL 为None；格式不完整时返回None
+    """
+    stack = [[]]
+    for match in IMAP_TOKEN_PATTERN.finditer(text, start):
+        token = match.group()
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) == 1:
+                return None
+            value = stack.pop()
+            stack[-1].append(value)
+            if len(stack) == 1:
+                return value
+        elif token[0] == '"':
+            stack[-1].append(IMAP_ESCAPE_PATTERN.sub(r'\1', token[1:-1]))
+        elif token.upper() == 'NIL':
+            stack[-1].append(None)
+        else:
+            stack[-1].append(token)
+    return None
+
+# 邮件中用于生成摘要的文本部分：段号、子类型 (plain/html)、传输编码、字符集
+TextPart = namedtuple('TextPart', ['section', 'subtype', 'encoding', 'charset'])
+
+def find_text_part(structure):
+    """
+    从 BODYSTRUCTURE 中找出正文所在的部分，优先第一个 text/plain，其次第一个 text/html，跳过附件。
+
+    Args:
+        structure: parse_imap_list 解析出的 BODYSTRUCTURE
+
+    Returns:
+        TextPart | None: 正文部分，没有时返回None
+    """
+    candidates = []
+
+    def walk(node, section):
+        if not isinstance(node, list) or not node:
+            return
+        if isinstance(node[0], list):
+            # multipart：开头连续的列表为各子部分，之后是子类型和扩展数据
+            for index, child in enumerate(node, 1):
+                if not isinstance(child, list):
+                    break
+                walk(child, f"{section}.{index}" if section else str(index))
+            return
+        if len(node) < 7 or (node[0] or '').lower() != 'text' or (node[1] or '').lower() not in ('plain', 'html'):
+            return
+        params = node[2] if isinstance(node[2], list) else []
+        params = {str(key).lower(): value for key, value in zip(params[::2], params[1::2])}
+        disposition = node[9] if len(node) > 9 and isinstance(node[9], list) else []
+        disposition_params = disposition[1] if len(disposition) > 1 and isinstance(disposition[1], list) else []
+        if params.get('name') or 'FILENAME' in [str(p).upper() for p in disposition_params[::2]] \
+                or (disposition and str(disposition[0]).lower() == 'attachment'):
+            return
+        candidates.append(TextPart(section or '1', node[1].lower(), (node[5] or '').lower(), params.get('charset')))
+
+    walk(structure, '')
+    for subtype in ('plain', 'html'):
+        for part in candidates:
+            if part.subtype == subtype:
+                return part
+    return None
+
+def decode_text_part(data, part):
+    """
+    解码按字节截取的正文部分，截断处不完整的编码单元会被丢弃。
+
+    Args:
+        data: 正文部分的原始字节 (可能被截断)
+        part: TextPart
+
+    Returns:
+        str: 正文文本，HTML会转换为纯文本
+    """
+    try:
+        if part.encoding == 'base64':
+            data = re.sub(rb'\s+', b'', data)
+            data = base64.b64decode(data[:len(data) - len(data) % 4])
+        elif part.encoding == 'quoted-printable':
+            data = quopri.decodestring(data)
+    except (binascii.Error, ValueError):
+        return ""
+    try:
+        text = data.decode(part.charset or 'utf-8', errors='ignore')
+    except LookupError:
+        text = data.decode('utf-8', errors='ignore')
+    text = text.replace('\r\n', '\n')
+    return html_to_text(text) if part.subtype == 'html' else text
+
+def fetch_partial_emails(mail, uids, max_body_bytes):
+    """
+    按块获取邮件的标头和正文开头部分：先批量获取标头和 BODYSTRUCTURE，
+    再按正文所在段号分组，批量获取每封邮件正文部分的前 max_body_bytes 字节，附件不会被下载。
+
+    Args:
+        mail: 已选择邮箱的IMAP连接
+        uids: 要获取的UID列表
+        max_body_bytes: 每封邮件正文最多获取的字节数
+
+    Yields:
+        tuple: (UID, 标头字节, 正文文本)
+    """
+    for i in range(0, len(uids), BODY_FETCH_CHUNK):
+        chunk = uids[i:i + BODY_FETCH_CHUNK]
+        headers = {}
+        text_parts = {}
+        for uid, items in fetch_in_chunks(mail, chunk, '(BODY.PEEK[HEADER] BODYSTRUCTURE)', BODY_FETCH_CHUNK):
+            headers[uid] = items.get('BODY[HEADER]', b'')
+            part = find_text_part(items.get('BODYSTRUCTURE'))
+            if part is not None:
+                text_parts[uid] = part
+
+        # 同一段号的邮件合并为一条命令
+        sections = {}
+        for uid, part in text_parts.items():
+            sections.setdefault(part.section, []).append(uid)
+        bodies = {}
+        for section, section_uids in sections.items():
+            prefix = f'BODY[{section}]'
+            fetch_items = f'(BODY.PEEK[{section}]<0.{max_body_bytes}>)'
+            for uid, items in fetch_in_chunks(mail, section_uids, fetch_items, BODY_FETCH_CHUNK):
+                data = next((value for name, value in items.items() if name.startswith(prefix)), b'')
+                bodies[uid] = decode_text_part(data, text_parts[uid])
+
+        for uid in chunk:
+            if uid in headers:
+                yield uid, headers[uid], bodies.get(uid, "")
+
+def fetch_in_chunks(mail, uids, fetch_items, chunk_size):
+    """
+    按块批量获取邮件，每块一条 UID FETCH 命令，处理完一块再取下一块。
+
+    Args:
+        mail: 已选择邮箱的IMAP连接
+        uids: 要获取的UID列表
+        fetch_items: FETCH数据项，如 '(BODY.PEEK[])'
+        chunk_size: 每条命令包含的邮件数
+
+    Yields:
+        tuple: (UID, {数据项名称: 内容字节})
+    """
+    for i in range(0, len(uids), chunk_size):
+        chunk = uids[i:i + chunk_size]
+        status, data = mail.uid('FETCH', format_uid_set(chunk), fetch_items)
+        if status != 'OK':
+            print(f"  - 警告: 批量获取 {len(chunk)} 封邮件失败, 跳过。")
+            continue
+        yield from parse_fetch_response(data)
+
+# 正文截断标记：转发/原始邮件分割线、回复引用头 (只匹配行首，单行内查找)
+QUOTE_SPLIT_PATTERN = re.compile(
+    r'^[ \t]*-+\s*(?:Original Message|Forwarded message)\s*-+'
+    r'|^[ \t]*On [^\n]{0,300}?wrote:'
+    r'|^[ \t]*在[^\n]{0,300}?写道：',
+    re.M,
+)
+QUOTED_LINE_PATTERN = re.compile(r'^[ \t]*>[^\n]*(?:\n|$)', re.M)
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+
 def extract_main_body(text):
     """
     智能提取邮件正文，移除引用和签名。
@@ -71,18 +373,104 @@ def extract_main_body(text):
     text = text.replace('&nbsp;', ' ').strip()
     
     # 使用常见分割线切分
-    text = re.split(r'\n-+\s*Original Message\s*-+|\n-+\s*Forwarded message\s*-+|On.*?wrote:|在.*?写道：', text, maxsplit=1)[0]
+    match = QUOTE_SPLIT_PATTERN.search(text)
+    if match:
+        text = text[:match.start()]
     
     # 移除逐行引用
-    lines = text.split('\n')
-    cleaned_lines = [line for line in lines if not line.strip().startswith('>')]
-    text = '\n'.join(cleaned_lines)
+    if '>' in text:
+        text = QUOTED_LINE_PATTERN.sub('', text)
     
     # 移除常见签名档分割线
     text = text.split('\n-- \n')[0].strip()
     
     # 清理多余的空行
-    return re.sub(r'\n\s*\n', '\n\n', text)
+    return BLANK_LINES_PATTERN.sub('\n\n', text)
+
+# HTML转文本时最多保留的可见字符数，摘要只用到正文开头
+HTML_TEXT_MAX_CHARS = 5000
+
+class VisibleTextParser(HTMLParser):
+    """
+    流式提取HTML中的可见文本：跳过脚本、样式等不可见元素，块级元素处换行，
+    收集到 max_chars 个字符后停止解析，剩余的HTML不再处理。
+    """
+
+    # 内容不可见的元素
+    SKIP_TAGS = frozenset(('script', 'style', 'head', 'title', 'noscript', 'template', 'svg'))
+    # 前后需要换行的元素
+    BLOCK_TAGS = frozenset((
+        'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'footer', 'form',
+        'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+        'section', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul',
+    ))
+
+    class Full(Exception):
+        """已收集到足够的文本"""
+
+    def __init__(self, max_chars=HTML_TEXT_MAX_CHARS):
+        """
+        Args:
+            max_chars: 最多收集的可见字符数
+        """
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        remaining = self.max_chars - self.length
+        self.parts.append(data[:remaining])
+        self.length += len(data)
+        if self.length >= self.max_chars:
+            raise self.Full()
+
+    def text(self):
+        """
+        Returns:
+            str: 每行去掉首尾空白、去掉空行后的文本
+        """
+        lines = ''.join(self.parts).replace('\xa0', ' ').split('\n')
+        return '\n'.join(line for line in (line.strip() for line in lines) if line)
+
+def html_to_text(body_html, max_chars=HTML_TEXT_MAX_CHARS):
+    """
+    提取HTML正文中的可见文本。
+
+    Args:
+        body_html: HTML文本
+        max_chars: 最多提取的可见字符数
+
+    Returns:
+        str: 纯文本
+    """
+    parser = VisibleTextParser(max_chars)
+    try:
+        parser.feed(body_html)
+        parser.close()
+    except VisibleTextParser.Full:
+        pass
+    return parser.text()
 
 def get_body_from_msg(msg):
     """
@@ -127,19 +515,40 @@ def get_body_from_msg(msg):
     if body_plain:
         return body_plain
     elif body_html:
-        soup = BeautifulSoup(body_html, 'html.parser')
-        # 移除脚本和样式，避免干扰
-        for script_or_style in soup(['script', 'style']):
-            script_or_style.decompose()
-        return soup.get_text(separator='\n', strip=True)
+        return html_to_text(body_html)
     return ""
 
-def get_emails(imap_server, imap_port, user_email, password, start_date, end_date, MAX_EMAILS_TO_SCAN=50, blacklist_emails=None):
+def selected_mailbox_value(mail, name):
+    """
+    读取SELECT返回的邮箱状态值，如 UIDVALIDITY、UIDNEXT。
+
+    Args:
+        mail: 已选择邮箱的IMAP连接
+        name: 状态名称
+
+    Returns:
+        int | None: 状态值，服务器未返回时为None
+    """
+    _, data = mail.response(name)
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def current_uidvalidity(mail):
+    """读取SELECT返回的UIDVALIDITY，服务器未返回时为None"""
+    return selected_mailbox_value(mail, 'UIDVALIDITY')
+
+def get_emails(imap_server, imap_port, user_email, password, start_date, end_date, MAX_EMAILS_TO_SCAN=50, blacklist_emails=None, cache=None, max_body_bytes=16384):
     """
     通过IMAP获取并解析指定日期范围内的邮件。
-    采用两阶段获取策略，避免下载大型邮件导致卡死。
+    采用两阶段获取策略，避免下载大型邮件导致卡死：
+    阶段1由服务器按日期搜索出候选邮件UID，再按Date标头精确筛选，并按From标头过滤自己发送的和黑名单中的邮件；
+    阶段2只获取筛选后邮件的标头和正文部分的前 max_body_bytes 字节，不下载附件。
+    传入 cache 时按账号记录同步检查点 (UIDVALIDITY + 最大UID + 覆盖的最早日期)，只搜索检查点之后的新邮件，
+    已复核过标头和已下载解析的邮件直接从缓存读取。
+    检查点只推进到实际复核过标头的UID，超出 MAX_EMAILS_TO_SCAN 未复核的邮件留给之后的运行。
     返回收到的邮件列表和统计信息（收到的邮件数、发送的邮件数）。
-    (已最终修复日期获取逻辑)
     
     Args:
         imap_server: IMAP服务器地址
@@ -149,153 +558,212 @@ def get_emails(imap_server, imap_port, user_email, password, start_date, end_dat
         start_date: 开始日期
         end_date: 结束日期
         MAX_EMAILS_TO_SCAN: 最大扫描邮件数量
-        blacklist_emails: 发件人黑名单列表，如果包含则过滤掉
+        blacklist_emails: 发件人黑名单，逗号分隔的字符串、列表或已编译的 SenderBlacklist
+        cache: 邮件缓存 (MailCache)，为None时每次完整获取
+        max_body_bytes: 每封邮件正文最多获取的字节数
     """
 
     print(f"正在连接到IMAP服务器 {imap_server}...")
-    original_timeout = socket.getdefaulttimeout()
-    socket.setdefaulttimeout(60)
-    
-    # 处理黑名单配置
-    if blacklist_emails is None:
-        blacklist_emails = []
-    elif isinstance(blacklist_emails, str):
-        # 如果是字符串，按逗号分割，并清理空格
-        blacklist_emails = [email.strip() for email in blacklist_emails.split(',') if email.strip()]
-    elif isinstance(blacklist_emails, list):
-        # 如果已经是列表，只需清理空格
-        blacklist_emails = [email.strip() for email in blacklist_emails if email.strip()]
     
-    if blacklist_emails:
-        print(f"已配置发件人黑名单: {', '.join(blacklist_emails)}")
+    # 编译黑名单配置 (相同配置在进程内只编译一次)
+    blacklist = compile_blacklist(blacklist_emails)
+    if blacklist:
+        print(f"已配置发件人黑名单: {blacklist.describe()}")
 
-    emails_data = []
     mail = None
     total_blacklist = 0  # 初始化黑名单计数器
+    account = f"{user_email.lower()}@{imap_server}/INBOX"
     try:
-        mail = imaplib.IMAP4_SSL(imap_server, imap_port)
+        # 超时只作用于本连接，不修改进程全局的默认超时 (批量模式下多个线程同时获取邮件)
+        mail = imaplib.IMAP4_SSL(imap_server, imap_port, timeout=IMAP_TIMEOUT)
         mail.login(user_email, password)
         mail.select('INBOX')
         print("IMAP连接成功。")
+
+        # 读取增量同步检查点，UIDVALIDITY 变化说明服务器重建了UID，缓存全部作废
+        uidvalidity = current_uidvalidity(mail) if cache is not None else None
+        uidnext = selected_mailbox_value(mail, 'UIDNEXT') if cache is not None else None
+        if uidvalidity is None:
+            cache = None
+        state = cache.get_state(account) if cache is not None else None
+        if state is not None and state.uidvalidity != uidvalidity:
+            print(f"邮箱UIDVALIDITY已变化 ({state.uidvalidity} -> {uidvalidity})，清除本地缓存。")
+            cache.reset(account)
+            state = None
+        # 检查点覆盖了开始日期时只需搜索新邮件
+        incremental = state is not None and start_date >= state.synced_since
  
-        # --- 第一阶段：快速筛选符合日期的邮件ID ---
-        print("\n--- 阶段1: 开始快速筛选邮件日期 ---")
-        
-        search_criteria = 'ALL' 
-        status, messages = mail.search(None, search_criteria)
+        # --- 第一阶段：服务器端按日期搜索，再按Date标头精确筛选 ---
+        print("\n--- 阶段1: 开始按日期搜索邮件 ---")
+
+        # SINCE/BEFORE 按服务器时区的收信日期匹配，前后各放宽一天，时区差异导致的边界邮件由下面的Date标头复核；
+        # 结束日期不早于今天时不加 BEFORE，搜索结果覆盖开始日期之后的全部邮件，才能据此建立检查点。
+        # 增量搜索不加日期条件：检查点之后的新UID (含收信日期较早的移入、APPEND邮件) 都要复核
+        since = format_imap_date(start_date - timedelta(days=1))
+        before = format_imap_date(end_date + timedelta(days=2))
+        open_ended = end_date >= datetime.now().date()
+        if incremental:
+            criteria = ['UID', f'{state.last_uid + 1}:*']
+        elif open_ended:
+            criteria = ['SINCE', since]
+        else:
+            criteria = ['SINCE', since, 'BEFORE', before]
+        status, messages = mail.uid('SEARCH', None, *criteria)
         if status != 'OK':
             print("搜索邮件失败!")
             return [], 0, 0, 0
  
-        email_ids = messages[0].split()
-        if not email_ids:
-            print("收件箱中没有任何邮件。")
-            return [], 0, 0, 0
+        email_ids = [int(uid) for uid in messages[0].split()]
+        if incremental:
+            # "n:*" 在没有新邮件时也会返回最大的UID
+            email_ids = [uid for uid in email_ids if uid > state.last_uid]
 
-        target_ids_to_scan = email_ids[-MAX_EMAILS_TO_SCAN:]
-        print(f"收件箱共有{len(email_ids)}封邮件, 准备扫描最近的 {len(target_ids_to_scan)} 封。")
+        # 已复核过标头的邮件不再获取；未复核的邮件最多复核最近的 MAX_EMAILS_TO_SCAN 封
+        email_dates = cache.known_dates(account, email_ids) if cache is not None else {}
+        unknown_ids = [uid for uid in email_ids if uid not in email_dates]
+        ids_to_check = unknown_ids[-MAX_EMAILS_TO_SCAN:]
+        truncated = len(unknown_ids) > len(ids_to_check)
+        print(f"服务器返回 {len(email_ids)} 封{'新' if incremental else '候选'}邮件 ({' '.join(criteria)}), "
+              f"其中 {len(email_dates)} 封已复核, 准备复核最近的 {len(ids_to_check)} 封。")
         
-        filtered_ids = []
-        for num in reversed(target_ids_to_scan):
+        # 批量获取候选邮件的Date和From标头 (PEEK 不会把邮件标记为已读)
+        checked_headers = {}
+        for uid, items in fetch_in_chunks(mail, ids_to_check, '(BODY.PEEK[HEADER.FIELDS (DATE FROM)])', HEADER_FETCH_CHUNK):
             try:
-                # =================== 核心修正部分 ===================
-                # 直接、高效地只获取邮件的Date标头，这是最可靠的方法
-                fetch_command = '(BODY[HEADER.FIELDS (DATE)])'
-                status, data = mail.fetch(num, fetch_command)
-                if status != 'OK' or not data or not data[0]:
-                    print(f"  - 警告: 获取邮件ID {safe_id_str(num)} 的Date标头失败, 跳过。")
-                    continue
-                
-                # data[0][1] 包含了 'Date: ...' 的字节串
-                header_bytes = data[0][1]
-                msg_header = email.message_from_bytes(header_bytes)
+                msg_header = email.message_from_bytes(next(iter(items.values()), b''))
                 date_str = msg_header['Date']
-                
+
                 # 如果Date标头为空或无法获取 (极少数情况)
                 if not date_str:
-                    print(f"  - 警告: 邮件ID {safe_id_str(num)} 的Date标头内容为空, 跳过。")
+                    print(f"  - 警告: 邮件ID {uid} 的Date标头内容为空, 跳过。")
                     continue
-                # ====================================================
- 
-                email_date = parsedate_to_datetime(date_str).date()
- 
-                if start_date <= email_date <= end_date:
-                    filtered_ids.append(num)
-                    print(f"  - 匹配成功: ID {safe_id_str(num)}, 日期 {email_date.strftime('%Y-%m-%d')}")
-                elif email_date < start_date:
-                    print(f"邮件日期({email_date.strftime('%Y-%m-%d')})已早于目标日期, 停止扫描。")
-                    break
+
+                sender = parseaddr(str(msg_header['From'] or ''))[1].lower().strip() or None
+                checked_headers[uid] = (email_local_date(date_str), sender)
             except Exception as e:
-                print(f"  - 警告: 解析邮件ID {safe_id_str(num)} 的日期时出错, 跳过。错误: {type(e).__name__}: {e}")
+                print(f"  - 警告: 解析邮件ID {uid} 的日期时出错, 跳过。错误: {type(e).__name__}: {e}")
                 continue
- 
+        email_dates.update((uid, email_date) for uid, (email_date, _) in checked_headers.items())
+
+        # 日期范围内的邮件：缓存中已有的 (含之前运行记录的) 加上本次复核匹配的
+        if cache is not None:
+            cache.save_headers(account, checked_headers)
+            entries = cache.messages_between(account, start_date, end_date)
+        else:
+            entries = {
+                uid: (sender, None) for uid, (email_date, sender) in checked_headers.items()
+                if start_date <= email_date <= end_date
+            }
+        cached_messages = {uid: data for uid, (_, data) in entries.items()}
+        senders = {uid: sender or (data or {}).get('sender') for uid, (sender, data) in entries.items()}
+        # 按从新到旧的顺序处理
+        filtered_ids = sorted(cached_messages, reverse=True)
+
+        # 更新检查点：最大UID只推进到其之前的搜索结果都已复核的位置
+        if cache is not None:
+            covered = set(email_dates) | set(ids_to_check)
+            if incremental:
+                # 增量搜索覆盖检查点之后的全部新UID，推进到第一封未复核的邮件之前
+                last_uid = state.last_uid
+                for uid in email_ids:
+                    if uid not in covered:
+                        break
+                    last_uid = uid
+                if last_uid > state.last_uid:
+                    cache.save_state(account, SyncState(uidvalidity, last_uid, state.synced_since))
+            elif open_ended and not truncated:
+                # 搜索覆盖了开始日期之后的全部邮件且全部复核，检查点可以推进到当前最大UID
+                last_uid = max(email_ids + ([uidnext - 1] if uidnext else []), default=0)
+                if last_uid:
+                    cache.save_state(account, SyncState(uidvalidity, last_uid, start_date))
+
         if not filtered_ids:
             print("\n在指定日期范围内没有找到符合条件的邮件。")
             return [], 0, 0, 0
             
-        print(f"\n--- 阶段1完成: 找到 {len(filtered_ids)} 封符合条件的邮件 ---\n")
+        # 按发件人过滤：自己发送的和黑名单中的邮件不下载正文
+        user_email_lower = user_email.lower()
+
+        def exclude_reason(sender):
+            if sender == user_email_lower:
+                return 'sent', None
+            matched = blacklist.match(sender)
+            return ('blacklist', matched) if matched else (None, None)
+
+        excluded = {}
+        for uid in filtered_ids:
+            if senders.get(uid):
+                reason, matched = exclude_reason(senders[uid])
+                if reason:
+                    excluded[uid] = (reason, matched)
+
+        print(f"\n--- 阶段1完成: 找到 {len(filtered_ids)} 封符合条件的邮件，其中 {len(excluded)} 封按发件人过滤 ---\n")
  
         # --- 第二阶段：获取筛选后邮件的完整内容 ---
         print("--- 阶段2: 开始获取邮件正文内容 ---")
-        user_email_lower = user_email.lower()
-        total_sent = 0
-        received_data_for_ai = []
+        ids_to_download = [uid for uid in filtered_ids if cached_messages[uid] is None and uid not in excluded]
+        print(f"其中 {len(filtered_ids) - len(excluded) - len(ids_to_download)} 封已在本地缓存, 需下载 {len(ids_to_download)} 封。")
 
-        for i, num in enumerate(filtered_ids):
-            print(f"正在处理第 {i+1}/{len(filtered_ids)} 封邮件 (ID: {safe_id_str(num)})...")
+        # 按块批量获取标头和正文开头部分，不下载附件；每块返回后逐封解析
+        processed = 0
+        for num, header_bytes, body_text in fetch_partial_emails(mail, ids_to_download, max_body_bytes):
+            processed += 1
+            print(f"正在处理第 {processed}/{len(ids_to_download)} 封邮件 (ID: {num})...")
             try:
-                status, data = mail.fetch(num, '(RFC822)')
-                if status != 'OK' or not data[0]:
-                    print(f"  - 获取邮件ID {safe_id_str(num)} 失败, 跳过。")
+                if not header_bytes:
+                    print(f"  - 获取邮件ID {num} 失败, 跳过。")
                     continue
                 
-                msg = email.message_from_bytes(data[0][1], policy=email_policy)
+                msg = email.message_from_bytes(header_bytes, policy=email_policy)
 
-                # --- 核心逻辑重构 ---
-                # 1. 解析真实发件人地址
                 # 使用 policy 后，可以直接从 msg 对象获取地址，它会自动处理解码
                 sender_name, sender_email_addr = parseaddr(str(msg['from']))
-                sender_email_addr = sender_email_addr.lower().strip()
-
-                # 2. 判断是否是自己发送的邮件
-                if sender_email_addr == user_email_lower:
-                    total_sent += 1
-                    print(f"  - 跳过自己发送的邮件: {from_address} (主题: {decode_str(msg['subject'])})")
-                    continue
-
-                # 3. 如果不是自己发送的，再检查是否在黑名单中
-                is_blacklisted = False
-                matched_black_item = None
-                for black_item in blacklist_emails:
-                    black_item = black_item.strip()
-                    if not black_item: continue
-                    
-                    if sender_email_addr == black_item or ('@' not in black_item and sender_email_addr.endswith('@' + black_item)):
-                        is_blacklisted = True
-                        matched_black_item = black_item
-                        break
-                
-                if is_blacklisted:
-                    total_blacklist += 1
-                    print(f"  - 跳过黑名单发件人邮件: {str(msg['from'])} (主题: {str(msg['subject'])}) - 匹配项: {matched_black_item}")
-                    continue
-
-                # 4. 通过所有过滤，加入待分析列表
-                body_text = get_body_from_msg(msg)
-                main_content = extract_main_body(body_text)
                 email_content = {
                     'from': str(msg['from']),
                     'to': str(msg['to']),
                     'subject': str(msg['subject']),
                     'date': str(msg['date']),
-                    'content': main_content,
+                    'content': extract_main_body(body_text),
+                    'sender': sender_email_addr.lower().strip(),
+                    'uid': num,
                 }
-                received_data_for_ai.append(email_content)
-                print(f"  - 已处理邮件: 主题='{email_content['subject']}'")
+                cached_messages[num] = email_content
+                if cache is not None:
+                    cache.save_message(account, num, email_dates.get(num) or email_local_date(email_content['date']), email_content)
 
             except Exception as e:
-                print(f"  - 处理邮件ID {safe_id_str(num)} 时发生严重错误, 跳过。错误: {e}")
+                print(f"  - 处理邮件ID {num} 时发生严重错误, 跳过。错误: {e}")
+                continue
+
+        # 过滤自己发送的和黑名单中的邮件；阶段1未能判断发件人的邮件按下载后的内容判断
+        total_sent = 0
+        received_data_for_ai = []
+        for num in filtered_ids:
+            email_content = cached_messages[num]
+            if num in excluded:
+                reason, matched_black_item = excluded[num]
+                sender_email_addr = senders[num]
+            elif email_content is None:
+                continue
+            else:
+                sender_email_addr = email_content['sender']
+                reason, matched_black_item = exclude_reason(sender_email_addr)
+
+            # 1. 判断是否是自己发送的邮件
+            if reason == 'sent':
+                total_sent += 1
+                print(f"  - 跳过自己发送的邮件: {sender_email_addr}")
+                continue
+
+            # 2. 如果不是自己发送的，再检查是否在黑名单中
+            if reason == 'blacklist':
+                total_blacklist += 1
+                print(f"  - 跳过黑名单发件人邮件: {sender_email_addr} - 匹配项: {matched_black_item}")
                 continue
+
+            # 3. 通过所有过滤，加入待分析列表
+            received_data_for_ai.append(email_content)
+            print(f"  - 已处理邮件: 主题='{email_content['subject']}'")
  
         print(f"\n--- 阶段2完成: 成功处理了 {len(received_data_for_ai)} 封邮件，过滤自己发送 {total_sent} 封，黑名单过滤 {total_blacklist} 封。---")
         total_received = len(received_data_for_ai)
@@ -320,78 +788,444 @@ def get_emails(imap_server, imap_port, user_email, password, start_date, end_dat
                 print("IMAP连接已关闭。")
             except Exception:
                 pass
-        socket.setdefaulttimeout(original_timeout)
 
 # --- AI 与推送 ---
+# 摘要报告中每封邮件的格式要求
+SUMMARY_FORMAT_PROMPT = (
+    "1. 【邮件主题】\n   - 发件人: [发件人姓名]\n   - 核心内容: [对邮件内容的1-2句话精炼总结，突出要点和待办事项]\n\n"
+    "2. 【另一封邮件主题】\n   - 发件人: [发件人姓名]\n   - 核心内容: [总结...]\n\n"
+    "如果邮件内容需要回复或处理，请在核心内容最后加上提醒，例如 '(需回复)'。"
+)
+# map阶段：逐封总结一批邮件
+MAP_SYSTEM_PROMPT = (
+    "你是一个专业的邮件摘要助手。请逐封总结下面这批邮件，不要遗漏，按以下格式输出，不要输出其他内容：\n\n"
+    + SUMMARY_FORMAT_PROMPT
+)
+# 分段总结结果的编号 (reduce 时重新编号)
+SUMMARY_ITEM_PATTERN = re.compile(r'^\s*\d+\s*[.、．]\s*', re.M)
+
+def format_email_for_summary(index, mail, max_chars):
+    """
+    把一封邮件整理为提交给AI的文本。
+
+    Args:
+        index: 邮件序号
+        mail: get_emails 返回的邮件
+        max_chars: 正文最多保留的字符数
+
+    Returns:
+        str: 邮件文本
+    """
+    content = mail.get('content', '')
+    content_snippet = content[:max_chars]
+    if len(content) > max_chars:
+        content_snippet += '...'
+    return (
+        f"邮件 {index}:\n"
+        f"发件人: {mail.get('from', '未知')}\n"
+        f"主题: {mail.get('subject', '无主题')}\n"
+        f"概要: {content_snippet}\n"
+    )
+
+def split_summary_batches(entries, max_tokens):
+    """
+    按token预算把邮件文本分批，单封超出预算的邮件单独成批。
+
+    Args:
+        entries: 邮件文本列表
+        max_tokens: 每批的token预算
+
+    Returns:
+        list: 每批的邮件文本列表
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for entry in entries:
+        tokens = estimate_tokens(entry)
+        if batch and batch_tokens + tokens > max_tokens:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(entry)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+class SummaryStats:
+    """按阶段 (map/reduce/single) 统计AI调用次数、耗时和token用量，多线程共用"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def call(self, client, stage, system_prompt, user_content):
+        """
+        调用AI并记录统计，接口未返回用量时按文本估算token数。
+
+        Returns:
+            str: 模型回复内容
+        """
+        start = time.monotonic()
+        reply, usage = client.chat_with_usage(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content},
+            ],
+            timeout=120,
+        )
+        elapsed = time.monotonic() - start
+        reply = reply or ""
+        prompt_tokens = usage.prompt_tokens if usage else estimate_tokens(system_prompt) + estimate_tokens(user_content)
+        completion_tokens = usage.completion_tokens if usage else estimate_tokens(reply)
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'calls': 0, 'call_time': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            stats['calls'] += 1
+            stats['call_time'] += elapsed
+            stats['prompt_tokens'] += prompt_tokens or 0
+            stats['completion_tokens'] += completion_tokens or 0
+        return reply
+
+    def set_elapsed(self, stage, elapsed):
+        """记录阶段的总耗时 (并发调用时小于各次调用耗时之和)"""
+        with self._lock:
+            self.stages.setdefault(stage, {'calls': 0, 'call_time': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0})['elapsed'] = elapsed
+
+    def log(self):
+        """打印各阶段统计"""
+        for stage, stats in self.stages.items():
+            print(
+                f"[邮件总结] {stage}: {stats['calls']} 次调用, 阶段耗时 {stats.get('elapsed', stats['call_time']):.2f} 秒 "
+                f"(调用合计 {stats['call_time']:.2f} 秒), prompt {stats['prompt_tokens']} tokens, "
+                f"回复 {stats['completion_tokens']} tokens"
+            )
+
 def summarize_with_ai(emails_list, total_received, total_sent, total_blacklist):
-    """调用AI API总结邮件内容。"""
+    """
+    调用AI API总结邮件内容。
+    邮件总量在一批的token预算 (EMAIL_SUMMARY_BATCH_TOKENS) 以内时一次总结；
+    超出时按预算分批，各批并发总结 (map，并发数 EMAIL_SUMMARY_CONCURRENCY)，再合并为报告 (reduce)。
+    每封邮件正文最多保留 EMAIL_SUMMARY_CONTENT_CHARS 个字符。
+    """
     
+    # 统计头信息总是由程序生成，不依赖AI
+    stats_line = f"今日共收到邮件 {total_received} 封，发送 {total_sent} 封，过滤通知消息 {total_blacklist} 封。"
     # 准备AI prompt的头部，这部分总是需要，无论是否有收到的邮件
     ai_prompt_header = (
         f"你是一个专业的邮件摘要助手。请根据以下邮件内容，为我生成一份今日（{datetime.now().date().strftime('%Y-%m-%d')}）的邮件摘要报告。"
         "报告格式如下：\n\n"
-        f"今日共收到邮件 {total_received} 封，发送 {total_sent} 封，过滤通知消息 {total_blacklist} 封。\n\n"
+        f"{stats_line}\n\n"
     )
 
     # 如果没有收到需要分析的邮件，直接返回统计信息
     if not emails_list:
-        return f"今日共收到邮件 {total_received} 封，发送 {total_sent} 封，过滤通知消息 {total_blacklist} 封。\n\n无需要AI分析的外部邮件。"
+        return f"{stats_line}\n\n无需要AI分析的外部邮件。"
 
     print("正在准备内容并调用AI进行总结...")
 
-    # --- 准备邮件正文内容 ---
-    formatted_emails = []
-    for i, mail in enumerate(emails_list):
-        content_snippet = mail.get('content', '')[:200]
-        if len(mail.get('content', '')) > 200:
-            content_snippet += '...'
-
-        formatted_emails.append(
-            f"邮件 {i+1}:\n"
-            f"发件人: {mail.get('from', '未知')}\n"
-            f"主题: {mail.get('subject', '无主题')}\n"
-            f"概要: {content_snippet}\n"
-        )
-    ai_input_content = "\n\n".join(formatted_emails)
+    # --- 准备邮件正文内容，按token预算分批 ---
+    content_chars = int(os.getenv("EMAIL_SUMMARY_CONTENT_CHARS", 500))
+    batch_tokens = int(os.getenv("EMAIL_SUMMARY_BATCH_TOKENS", 6000))
+    entries = [format_email_for_summary(i + 1, mail, content_chars) for i, mail in enumerate(emails_list)]
+    batches = split_summary_batches(entries, batch_tokens)
 
     # --- 构建完整的System Prompt ---
     system_prompt = (
         ai_prompt_header +
-        "******邮件内容******\n\n"
-        "1. 【邮件主题】\n   - 发件人: [发件人姓名]\n   - 核心内容: [对邮件内容的1-2句话精炼总结，突出要点和待办事项]\n\n"
-        "2. 【另一封邮件主题】\n   - 发件人: [发件人姓名]\n   - 核心内容: [总结...]\n\n"
-        "如果邮件内容需要回复或处理，请在核心内容最后加上提醒，例如 '(需回复)'。"
+        "******邮件内容******\n\n" +
+        SUMMARY_FORMAT_PROMPT +
         "请确保总结简明扼要，严格遵循以上格式。"
     )
     
     # --- 调用AI ---
+    stats = SummaryStats()
+    start = time.monotonic()
     try:
-        ai_api_key = os.getenv("AI_API_KEY")
-        ai_base_url = os.getenv("AI_BASE_URL")
-        AI_MODEL_NAME = os.getenv("AI_MODEL_NAME")
+        client = get_llm_client()
+
+        if len(batches) == 1:
+            ai_summary = stats.call(client, 'single', system_prompt, "\n\n".join(entries))
+            stats.set_elapsed('single', time.monotonic() - start)
+        else:
+            ai_summary = map_reduce_summary(client, stats, batches, system_prompt, batch_tokens)
 
-        client = OpenAI(api_key=ai_api_key, base_url=ai_base_url)
-        
-        response = client.chat.completions.create(
-            model=AI_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": ai_input_content},
-            ],
-            stream=False,
-            timeout=120,
-        )
         # 将AI生成的摘要与我们可靠的统计头信息结合
-        ai_summary = response.choices[0].message.content
         # 从AI返回内容中提取邮件主体部分，避免重复统计信息
         if "******邮件内容******" in ai_summary:
             ai_summary = ai_summary.split("******邮件内容******", 1)[1]
 
-        return f"今日共收到邮件 {total_received} 封，发送 {total_sent} 封，过滤通知消息 {total_blacklist} 封。\n\n******邮件内容******{ai_summary}"
+        return f"{stats_line}\n\n******邮件内容******{ai_summary}"
 
     except Exception as e:
         print(f"[错误] 调用AI API时发生错误: {e}")
         return f"AI总结失败：{e}"
+    finally:
+        stats.log()
+
+def map_reduce_summary(client, stats, batches, system_prompt, batch_tokens):
+    """
+    分批总结后合并：各批并发逐封总结 (map)，再把分批结果合并为报告 (reduce)。
+    某一批总结失败时保留该批邮件的发件人和主题；分批结果超出预算时不再调用AI合并，直接按顺序重新编号拼接。
+
+    Args:
+        client: 大模型客户端
+        stats: SummaryStats
+        batches: split_summary_batches 的结果
+        system_prompt: 报告格式的System Prompt
+        batch_tokens: 每批的token预算
+
+    Returns:
+        str: 报告正文
+    """
+    concurrency = max(1, min(int(os.getenv("EMAIL_SUMMARY_CONCURRENCY", 4)), len(batches)))
+    print(f"邮件较多，分 {len(batches)} 批总结 (并发 {concurrency})...")
+
+    def summarize_batch(batch):
+        try:
+            return stats.call(client, 'map', MAP_SYSTEM_PROMPT, "\n\n".join(batch))
+        except Exception as e:
+            print(f"[错误] 分批总结失败，保留邮件主题: {e}")
+            return "\n".join(
+                f"{i}. " + " | ".join(line for line in entry.splitlines()[1:3])
+                for i, entry in enumerate(batch, 1)
+            )
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="email-map") as executor:
+        partials = list(executor.map(summarize_batch, batches))
+    stats.set_elapsed('map', time.monotonic() - start)
+
+    # 去掉各批的编号，合并时统一重新编号
+    items = []
+    for partial in partials:
+        parts = SUMMARY_ITEM_PATTERN.split(partial.strip())
+        items.extend(part.strip() for part in parts if part.strip())
+    merged = "\n\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+
+    if estimate_tokens(merged) > batch_tokens:
+        print("分批总结结果超出单次预算，直接合并。")
+        return f"\n\n{merged}"
+
+    start = time.monotonic()
+    reduce_prompt = (
+        system_prompt +
+        "\n\n下面是已经逐封总结好的邮件，请合并为一份报告：同一事项的多封邮件合并为一条，"
+        "需回复或处理的事项排在前面，不要遗漏其他邮件。"
+    )
+    try:
+        return stats.call(client, 'reduce', reduce_prompt, merged)
+    except Exception as e:
+        print(f"[错误] 合并分批总结失败，直接合并: {e}")
+        return f"\n\n{merged}"
+    finally:
+        stats.set_elapsed('reduce', time.monotonic() - start)
+
+# --- 任务入口 ---
+
+WEEK_NAMES = ("星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日")
+
+def load_email_dict():
+    """
+    读取 EMAIL_DICT 中配置的邮箱字典。
+
+    Returns:
+        dict: 用户名 -> 邮箱配置，未配置或格式错误时返回空字典
+    """
+    email_dict_str = os.getenv("EMAIL_DICT")
+    if not email_dict_str:
+        return {}
+    try:
+        return json.loads(email_dict_str)
+    except json.JSONDecodeError as e:
+        print(f"EMAIL_DICT 格式错误: {e}")
+        return {}
+
+def fetch_account_emails(email_config, day):
+    """
+    获取一个邮箱指定日期的邮件。
+
+    Args:
+        email_config: EMAIL_DICT 中的邮箱配置
+        day: 日期
+
+    Returns:
+        tuple: get_emails 的返回值
+    """
+    return get_emails(
+        email_config["IMAP_SERVER"], email_config["IMAP_PORT"], email_config["USER_EMAIL"], email_config["PASSWORD"],
+        start_date=day, end_date=day,
+        MAX_EMAILS_TO_SCAN=int(os.getenv("MAX_EMAILS_TO_SCAN", 200)),
+        # 用户级别的黑名单配置
+        blacklist_emails=email_config.get("EMAIL_BLACKLIST", ""),
+        cache=get_mail_cache(),
+        max_body_bytes=int(os.getenv("EMAIL_BODY_MAX_BYTES", 16384)),
+    )
+
+def build_summary_content(day, summary_text):
+    """组装推送的总结消息"""
+    return (
+        f"{day.strftime('%Y-%m-%d')} {WEEK_NAMES[day.weekday()]}\n\n"
+        "********总结********\n\n"
+        f"{summary_text}"
+    )
+
+def run_email_summary(touser):
+    """
+    获取指定用户今日的邮件，生成AI总结并推送给该用户。
+    配置从环境变量读取，调用方需先加载 .env。
+
+    Args:
+        touser: 推送目标用户，同时作为 EMAIL_DICT 中的邮箱配置键
+    """
+    print("--- 每日邮件总结任务开始 ---")
+
+    # 1. 获取邮件
+    # 根据用户名获取对应的邮箱配置，默认只收今天的邮件
+    email_dict = load_email_dict()
+    if touser not in email_dict:
+        print(f"未找到用户 {touser} 的邮箱配置，退出。")
+        return
+    today = datetime.now().date()
+    emails, total_received, total_sent, total_blacklist = fetch_account_emails(email_dict[touser], today)
+
+    # 2. 生成总结
+    # 简化报告生成逻辑，无论是否有收到邮件，都统一处理
+    summary_text = summarize_with_ai(emails, total_received, total_sent, total_blacklist)
+    content = build_summary_content(today, summary_text)
+
+    print("\n--- 生成的总结内容 ---\n")
+    print(content)
+    print("\n---------------------\n")
+
+    # 3. 推送消息
+    wxid = os.getenv("WEIXIN_CORP_ID")
+    wxsecret = os.getenv("WEIXIN_CORP_SECRET")
+    agentid = os.getenv("WEIXIN_AGENT_ID")
+    send_message(wxid, wxsecret, agentid, touser, content)
+
+class ServerConnectionLimiter:
+    """
+    按IMAP服务器限制同时打开的连接数，多线程共用。
+    同一服务商的多个邮箱同时登录过多时容易被限流或拒绝连接。
+    """
+
+    def __init__(self, max_per_server):
+        """
+        Args:
+            max_per_server: 每个IMAP服务器同时打开的连接数上限
+        """
+        self.max_per_server = max_per_server
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def get(self, imap_server):
+        """
+        获取服务器对应的信号量。
+
+        Args:
+            imap_server: IMAP服务器地址
+
+        Returns:
+            threading.BoundedSemaphore: 该服务器的连接数信号量
+        """
+        key = imap_server.strip().lower()
+        with self._lock:
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = self._semaphores[key] = threading.BoundedSemaphore(self.max_per_server)
+        return semaphore
+
+def run_email_summary_all(users=None):
+    """
+    批量模式：并发处理 EMAIL_DICT 中的所有邮箱 (或 users 指定的部分)，生成总结并推送给各自的用户。
+
+    - 邮件获取在 EMAIL_FETCH_WORKERS 个线程中并发执行，同一IMAP服务器同时最多 EMAIL_SERVER_CONNECTIONS 个连接
+    - 某个邮箱获取完成后立即提交AI总结，总结与其他邮箱的获取并行；AI并发由共享客户端的 AI_MAX_CONCURRENCY 限制
+    - 推送按 WEIXIN_SEND_RATE 限速
+    配置从环境变量读取，调用方需先加载 .env。
+
+    Args:
+        users: 要处理的用户列表，为None时处理全部邮箱
+
+    Returns:
+        dict: 用户名 -> 是否推送成功
+    """
+    email_dict = load_email_dict()
+    if users is not None:
+        for user in users:
+            if user not in email_dict:
+                print(f"未找到用户 {user} 的邮箱配置，跳过。")
+        email_dict = {user: email_dict[user] for user in users if user in email_dict}
+    if not email_dict:
+        print("没有需要处理的邮箱，退出。")
+        return {}
+
+    print(f"--- 批量邮件总结任务开始: {len(email_dict)} 个邮箱 ---")
+    start = time.monotonic()
+    today = datetime.now().date()
+    wxid = os.getenv("WEIXIN_CORP_ID")
+    wxsecret = os.getenv("WEIXIN_CORP_SECRET")
+    agentid = os.getenv("WEIXIN_AGENT_ID")
+    limiter = ServerConnectionLimiter(int(os.getenv("EMAIL_SERVER_CONNECTIONS", 4)))
+    rate_limiter = RateLimiter(float(os.getenv("WEIXIN_SEND_RATE", 10)))
+    timings = {}
+
+    def fetch(user, email_config):
+        wait_start = time.monotonic()
+        with limiter.get(email_config["IMAP_SERVER"]):
+            fetch_start = time.monotonic()
+            result = fetch_account_emails(email_config, today)
+        timings[user] = {'wait': fetch_start - wait_start, 'fetch': time.monotonic() - fetch_start}
+        return result
+
+    def summarize_and_send(user, result):
+        summary_start = time.monotonic()
+        summary_text = summarize_with_ai(*result)
+        timings[user]['summary'] = time.monotonic() - summary_start
+        send_start = time.monotonic()
+        rate_limiter.wait()
+        ok = send_message(wxid, wxsecret, agentid, user, build_summary_content(today, summary_text))
+        timings[user]['send'] = time.monotonic() - send_start
+        return ok
+
+    results = {}
+    fetch_workers = min(int(os.getenv("EMAIL_FETCH_WORKERS", 16)), len(email_dict))
+    summary_workers = min(int(os.getenv("AI_MAX_CONCURRENCY", 8)), len(email_dict))
+    with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="email-fetch") as fetch_executor, \
+            ThreadPoolExecutor(max_workers=summary_workers, thread_name_prefix="email-summary") as summary_executor:
+        fetch_futures = {
+            fetch_executor.submit(fetch, user, email_config): user for user, email_config in email_dict.items()
+        }
+        summary_futures = {}
+        for future in as_completed(fetch_futures):
+            user = fetch_futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[错误] 邮箱 {user} 获取失败: {e}")
+                results[user] = False
+                continue
+            summary_futures[summary_executor.submit(summarize_and_send, user, result)] = user
+        for future in as_completed(summary_futures):
+            user = summary_futures[future]
+            try:
+                results[user] = future.result()
+            except Exception as e:
+                print(f"[错误] 邮箱 {user} 总结或推送失败: {e}")
+                results[user] = False
+
+    print("\n--- 各邮箱耗时 ---")
+    for user in email_dict:
+        timing = timings.get(user, {})
+        print(
+            f"  {user}: 等待连接 {timing.get('wait', 0):.2f}s, 获取邮件 {timing.get('fetch', 0):.2f}s, "
+            f"AI总结 {timing.get('summary', 0):.2f}s, 推送 {timing.get('send', 0):.2f}s, "
+            f"{'成功' if results.get(user) else '失败'}"
+        )
+    succeeded = sum(1 for ok in results.values() if ok)
+    print(f"--- 批量邮件总结完成: 成功 {succeeded}/{len(email_dict)}, 总耗时 {time.monotonic() - start:.2f} 秒 ---")
+    http_client.log_stats()
+    return results
 
 # --- 测试 ---
 
@@ -399,7 +1233,6 @@ if __name__ == '__main__':
     # 添加防止重复执行的机制
     import sys
     import os
-    import ast
     
     # 检查是否已经有实例在运行
     lock_file = "/tmp/send_email_summary.lock"
@@ -414,75 +1247,25 @@ if __name__ == '__main__':
     try:
         with open(lock_file, 'w') as f:
             f.write(str(os.getpid()))
-        
-        print("--- 每日邮件总结任务开始 ---")   
 
-        # 1. 获取邮件
-        # 邮箱配置,默认只收今天的邮件
         from dotenv import load_dotenv
         load_dotenv(dotenv_path='../.env')
         
-        # 用户名入参
-        if len(sys.argv) > 1:
-            touser = sys.argv[1]
-        else:
-            # 如果没有提供命令行参数，则使用默认用户
-            touser = "HuangWeiShen"  # 默认用户
-        
-        # 从环境变量中获取邮箱配置字典
-        email_dict_str = os.getenv("EMAIL_DICT")
-        email_dict = json.loads(email_dict_str) if email_dict_str else {}
-        
-        # 根据用户名获取对应的邮箱配置
-        if touser in email_dict:
-            email_config = email_dict[touser]
-            imap_server = email_config["IMAP_SERVER"]
-            imap_port = email_config["IMAP_PORT"]
-            user_email = email_config["USER_EMAIL"]
-            password = email_config["PASSWORD"]
-            # 获取用户级别的黑名单配置
-            blacklist_emails = email_config.get("EMAIL_BLACKLIST", "")
+        if len(sys.argv) > 1 and sys.argv[1] == '--all':
+            # 批量模式：用户可通过参数指定 (用 | 或 , 分隔)，否则处理 EMAIL_DICT 中的全部邮箱
+            users = None
+            if len(sys.argv) > 2:
+                users = [user.strip() for user in sys.argv[2].replace(',', '|').split('|') if user.strip()]
+            run_email_summary_all(users)
         else:
-            print(f"未找到用户 {touser} 的邮箱配置，退出。")
-            exit(1)
-
-        max_emails = int(os.getenv("MAX_EMAILS_TO_SCAN", 200))
-        today = datetime.now().date()
-        emails, total_received, total_sent, total_blacklist = get_emails(imap_server, imap_port, user_email, password, start_date=today, end_date=today,  MAX_EMAILS_TO_SCAN=max_emails, blacklist_emails=blacklist_emails)
-
-        # 2. 生成总结
-        week_dict = {
-            0:"星期一",
-            1:"星期二",
-            2:"星期三",
-            3:"星期四",
-            4:"星期五",
-            5:"星期六",
-            6:"星期日"
-        }
-        day = today.strftime("%Y-%m-%d") + " " + week_dict[today.weekday()]
-
-
-        # 简化报告生成逻辑，无论是否有收到邮件，都统一处理
-        summary_text = summarize_with_ai(emails, total_received, total_sent, total_blacklist)
-        content = (
-            f"{day}\n\n"
-            "********总结********\n\n"
-            f"{summary_text}"
-        )
+            # 用户名入参
+            if len(sys.argv) > 1:
+                touser = sys.argv[1]
+            else:
+                # 如果没有提供命令行参数，则使用默认用户
+                touser = "HuangWeiShen"  # 默认用户
 
-        print("\n--- 生成的总结内容 ---\n")
-        print(content)
-        print("\n---------------------\n")
-
-        # 3. 推送消息
-        from send_message import send_message
-        # 加载微信配置
-        wxid = os.getenv("WEIXIN_CORP_ID")
-        wxsecret = os.getenv("WEIXIN_CORP_SECRET")
-        agentid = os.getenv("WEIXIN_AGENT_ID")
-        # touser = os.getenv("WEIXIN_TO_USER")
-        send_message(wxid, wxsecret, agentid, touser, content)
+            run_email_summary(touser)
     
     finally:
         # 删除锁文件
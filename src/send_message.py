@@ -5,56 +5,145 @@
 @description : 企业微信消息推送模块
 """
 
-import requests
+import threading
+import time
 
-def send_message(wxid, wxsecret, agentid, touser, content):
+try:
+    from . import http_client
+    from .wecom_token import get_token_manager, TOKEN_INVALID_ERRCODES
+except ImportError:
+    import http_client
+    from wecom_token import get_token_manager, TOKEN_INVALID_ERRCODES
+
+# 单条消息最多指定的成员数
+MAX_USERS_PER_MESSAGE = 1000
+# 文本消息内容的字节数上限 (UTF-8)
+MAX_TEXT_BYTES = 2048
+
+def send_message(wxid, wxsecret, agentid, touser, content, toparty=None, totag=None):
     """
     发送消息到企业微信。
+    access_token 由 wecom_token 统一缓存，token失效时自动刷新并重试一次。
 
     Args:
         wxid: 企业微信CorpID
         wxsecret: 企业微信应用Secret
         agentid: 企业微信应用AgentID
-        touser: 推送目标用户
+        touser: 推送目标用户，多个用 | 分隔，"@all" 表示全部成员
         content: 要发送的消息内容
+        toparty: 推送目标部门ID，多个用 | 分隔 (可选)
+        totag: 推送目标标签ID，多个用 | 分隔 (可选)
+
+    Returns:
+        bool: 发送成功返回True
     """
     try:
-        # 获取access_token
-        token_url = f'https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={wxid}&corpsecret={wxsecret}'
-        try:
-            token_response = requests.post(url=token_url, data="").json()
-            if token_response.get('errcode') != 0:
-                print(f"获取token失败: {token_response.get('errmsg', '未知错误')}")
-                return
-            wx_push_token = token_response['access_token']
-        except Exception as e:
-            print(f"获取token异常: {e}")
-            return
+        token_manager = get_token_manager(wxid, wxsecret)
 
         # 构建推送数据
         wx_push_data = {
             "agentid": agentid,
             "msgtype": "text",
-            "touser": touser,
+            "touser": touser or "",
             "text": {
                 "content": content
             },
             "safe": 0
         }
+        if toparty:
+            wx_push_data["toparty"] = toparty
+        if totag:
+            wx_push_data["totag"] = totag
+
+        for attempt in range(2):
+            # 获取access_token
+            wx_push_token = token_manager.get_token()
+            if not wx_push_token:
+                return False
+
+            # 发送消息
+            push_url = f'https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={wx_push_token}'
+            push_response = http_client.post(push_url, json=wx_push_data).json()
 
-        # 发送消息
-        push_url = f'https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={wx_push_token}'
-        push_response = requests.post(push_url, json=wx_push_data).json()
+            if push_response.get('errcode') in TOKEN_INVALID_ERRCODES and attempt == 0:
+                print(f"access_token已失效({push_response.get('errcode')})，刷新后重试")
+                token_manager.invalidate(wx_push_token)
+                continue
+            break
         
         if push_response.get('errcode') != 0:
             print(f"发送消息失败: {push_response.get('errmsg', '未知错误')}")
-        else:
-            print("消息发送成功")
+            return False
+        if push_response.get('invaliduser'):
+            print(f"部分成员无效: {push_response['invaliduser']}")
+        print("消息发送成功")
+        return True
             
     except Exception as e:
         print(f"发送消息异常: {e}")
+        return False
 
 
+class RateLimiter:
+    """
+    简单的发送限速器，保证相邻两次发送的间隔不小于 1/rate 秒，多线程共用。
+    """
+
+    def __init__(self, rate):
+        """
+        Args:
+            rate: 每秒最多发送次数，小于等于0表示不限速
+        """
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """阻塞直到允许下一次发送"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            send_time = max(now, self._next_time)
+            self._next_time = send_time + self.interval
+        if send_time > now:
+            time.sleep(send_time - now)
+
+
+def broadcast_message(wxid, wxsecret, agentid, content, users=None, toparty=None, totag=None, rate_limiter=None):
+    """
+    把同一条内容推送给多个成员/部门/标签。
+    成员按 | 拼接，每条消息最多 MAX_USERS_PER_MESSAGE 人，超出时分批发送。
+
+    Args:
+        wxid: 企业微信CorpID
+        wxsecret: 企业微信应用Secret
+        agentid: 企业微信应用AgentID
+        content: 要发送的消息内容
+        users: 推送目标成员列表
+        toparty: 推送目标部门ID，多个用 | 分隔 (可选)
+        totag: 推送目标标签ID，多个用 | 分隔 (可选)
+        rate_limiter: 发送限速器 (可选)
+
+    Returns:
+        int: 发送成功的消息条数
+    """
+    users = list(users or [])
+    batches = [users[i:i + MAX_USERS_PER_MESSAGE] for i in range(0, len(users), MAX_USERS_PER_MESSAGE)]
+    if not batches and (toparty or totag):
+        batches = [[]]
+    sent = 0
+    for i, batch in enumerate(batches):
+        if rate_limiter:
+            rate_limiter.wait()
+        # 部门和标签只需随第一批发送
+        ok = send_message(
+            wxid, wxsecret, agentid, "|".join(batch), content,
+            toparty=toparty if i == 0 else None, totag=totag if i == 0 else None,
+        )
+        sent += ok
+    return sent
+
 
 if __name__ == '__main__':
     from dotenv import load_dotenv
@@ -5,11 +5,26 @@
 @description : 天气推送模块，获取天气、新闻和每日金句并推送至企业微信
 """
 
-import requests
+import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 
+try:
+    from . import http_client
+    from . import content_cache
+    from .content_cache import cached
+    from .send_message import broadcast_message, RateLimiter
+except ImportError:
+    import http_client
+    import content_cache
+    from content_cache import cached
+    from send_message import broadcast_message, RateLimiter
 
+
+# 天气10分钟更新一次，按城市缓存；timestamps 只用于绕过浏览器缓存，不参与缓存键
+@cached('weather', ttl=600, stale_ttl=1800, key=lambda cookie, city_code, timestamps: city_code)
 def weather_info(cookie, city_code, timestamps):
     """
     获取天气信息。
@@ -37,7 +52,7 @@ def weather_info(cookie, city_code, timestamps):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.71 Safari/537.36 Edg/94.0.992.38"
     }
     weather_url = f'http://d1.weather.com.cn/dingzhi/{city_code}.html?_={timestamps}'
-    weather_req = requests.get(url=weather_url,headers=w_headers, timeout=30).content.decode('utf-8')
+    weather_req = http_client.get(url=weather_url,headers=w_headers, timeout=30).content.decode('utf-8')
     try:
         weather_data = json.loads(weather_req.replace(f"var cityDZ{city_code} =", "").split(f";var alarmDZ{city_code} =")[0])
         weather_info = weather_data['weatherinfo']
@@ -61,6 +76,7 @@ def weather_info(cookie, city_code, timestamps):
     )
     return weather_messages
 
+@cached('news', ttl=600, stale_ttl=1800)
 def get_news(news_type, news_time):
     """
     获取新闻信息。
@@ -86,7 +102,7 @@ def get_news(news_type, news_time):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.71 Safari/537.36 Edg/94.0.992.38"
     }
     news_url = f'http://top.news.sina.com.cn/ws/GetTopDataList.php?top_type=day&top_cat={news_type}&top_time={news_time}&top_show_num=20&top_order=DESC&js_var=news_'
-    news_req = requests.get(url=news_url,headers=news_headers, timeout=30).text.replace("var news_ = ","").replace(r"\/\/","//").replace(";","")
+    news_req = http_client.get(url=news_url,headers=news_headers, timeout=30).text.replace("var news_ = ","").replace(r"\/\/","//").replace(";","")
     try:
         news_data = json.loads(news_req)
         news_sub = news_data.get('data', [])
@@ -103,23 +119,35 @@ def get_news(news_type, news_time):
             news_list.append(news)
     return news_list
 
-def get_sentence():
+@cached('sentence', ttl=3600)
+def fetch_sentence():
     """
-    获取每日金句。
+    请求每日金句接口，失败时抛出异常。
 
     Returns:
         str: 格式化的金句内容
     """
     print("--- 正在获取每日金句 ---")
     sen_url = 'https://v1.hitokoto.cn?c=d&c=h&c=i&c=k'
+    get_sen = http_client.get(url=sen_url, timeout=10).json()
+    return f"{get_sen['hitokoto']}\n\n出自：{get_sen['from']}"
+
+def get_sentence():
+    """
+    获取每日金句。
+
+    Returns:
+        str: 格式化的金句内容
+    """
     try:
-        get_sen = requests.get(url=sen_url, timeout=10).json()
-        sentence = f"{get_sen['hitokoto']}\n\n出自：{get_sen['from']}"
+        sentence = fetch_sentence()
     except:
         sentence = "今日无金句，请继续努力！"
 
     return sentence
 
+# 金融数据每日更新一次
+@cached('financial', ttl=3600, stale_ttl=6 * 3600)
 def get_financial_data():
     """获取金融数据"""
     print("--- 正在获取金融数据 ---")
@@ -127,7 +155,7 @@ def get_financial_data():
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
     }
-    response = requests.get(url, headers=headers)
+    response = http_client.get(url, headers=headers, timeout=(5, 30))
     response.encoding = 'utf-8'
     
     # 跳过第一行，并保留后续所有行
@@ -135,13 +163,12 @@ def get_financial_data():
     filtered_lines = [line.strip() for line in lines[1:]]
     return '\n'.join(filtered_lines)
 
-def message_content(city_code, timestamps, info_time, news_list, financial, sentence):
+def message_content(weather, info_time, news_list, financial, sentence):
     """
     组装消息内容。
 
     Args:
-        city_code: 城市代码
-        timestamps: 时间戳
+        weather: 天气信息
         info_time: 信息时间
         news_list: 新闻列表
         financial: 金融数据
@@ -163,7 +190,7 @@ def message_content(city_code, timestamps, info_time, news_list, financial, sent
     content = (
         f"{day}\n\n"
         "********天气********\n\n"
-        f"{weather_info(cookie, city_code, timestamps)}\n\n"
+        f"{weather}\n\n"
         "******热点新闻******\n\n"
         f"{chr(10).join(news_list[:3])}\n\n"  # 只截取前3条新闻，微信推送有长度限制
         "******投资风向******\n\n"
@@ -174,10 +201,160 @@ def message_content(city_code, timestamps, info_time, news_list, financial, sent
     print(content)
     return content
 
+# 各板块的获取时限（秒），超时或失败只影响该板块，使用默认内容
+SECTION_DEADLINES = {
+    'weather': 15,
+    'news': 15,
+    'financial': 10,
+    'sentence': 8,
+}
+
+# 各板块获取失败时的默认内容
+SECTION_FALLBACKS = {
+    'weather': "天气信息获取失败",
+    'news': ["热点新闻获取失败"],
+    'financial': "金融数据获取失败",
+    'sentence': "今日无金句，请继续努力！",
+}
+
+def fetch_sections(sections):
+    """
+    并发获取各板块内容，每个板块有独立的时限，超时或失败的板块使用默认内容。
+
+    Args:
+        sections: 板块名 -> (板块类型, 获取函数, 参数元组)，板块类型对应 SECTION_DEADLINES 的键
+
+    Returns:
+        dict: 板块名 -> 内容
+    """
+    start = time.monotonic()
+    timings = {}
+
+    def timed(name, func, args):
+        section_start = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            timings[name] = time.monotonic() - section_start
+
+    executor = ThreadPoolExecutor(max_workers=len(sections))
+    futures = {
+        name: executor.submit(timed, name, func, args)
+        for name, (kind, func, args) in sections.items()
+    }
+    results = {}
+    for name, future in futures.items():
+        kind = sections[name][0]
+        remaining = start + SECTION_DEADLINES[kind] - time.monotonic()
+        try:
+            results[name] = future.result(timeout=max(remaining, 0))
+            print(f"  - {name} 获取完成，耗时 {timings[name]:.2f} 秒")
+        except FutureTimeoutError:
+            print(f"  - {name} 获取超时 ({SECTION_DEADLINES[kind]} 秒)，使用默认内容")
+            results[name] = SECTION_FALLBACKS[kind]
+        except Exception as e:
+            print(f"  - {name} 获取失败，使用默认内容: {type(e).__name__}: {e}")
+            results[name] = SECTION_FALLBACKS[kind]
+    # 不等待超时的请求，后台线程在请求超时后自行结束
+    executor.shutdown(wait=False)
+    print(f"--- 信息获取完成，总耗时 {time.monotonic() - start:.2f} 秒 ---")
+    return results
+
+def load_user_cities():
+    """
+    读取 WEATHER_USER_CITIES 中配置的成员城市映射。
+
+    Returns:
+        dict: 成员 -> 城市代码，未配置或格式错误时返回空字典
+    """
+    user_cities_str = os.getenv("WEATHER_USER_CITIES")
+    if not user_cities_str:
+        return {}
+    try:
+        return json.loads(user_cities_str)
+    except json.JSONDecodeError as e:
+        print(f"WEATHER_USER_CITIES 格式错误: {e}")
+        return {}
+
+def run_weather_broadcast(users=None, toparty=None, totag=None):
+    """
+    广播模式：新闻、金融数据和每日金句只获取一次，天气按城市各获取一次，
+    同城成员合并为一条消息 (touser 用 | 拼接)，不同城市的消息并发限速发送。
+    部门和标签无法区分城市，统一使用默认城市的内容。
+    配置从环境变量读取，调用方需先加载 .env。
+
+    Args:
+        users: 推送目标成员列表
+        toparty: 推送目标部门ID，多个用 | 分隔 (可选)
+        totag: 推送目标标签ID，多个用 | 分隔 (可选)
+    """
+    print("--- 开始获取信息 ---")
+
+    # 获取配置参数
+    default_city_code = os.getenv('WEATHER_CITY_CODE', '101190601')
+    cookie = os.getenv('WEATHER_COOKIE')
+    news_type = os.getenv('NEWS_TYPE', 'www_www_all_suda_suda')
+    wxid = os.getenv("WEIXIN_CORP_ID")
+    wxsecret = os.getenv("WEIXIN_CORP_SECRET")
+    agentid = os.getenv("WEIXIN_AGENT_ID")
+    user_cities = load_user_cities()
+
+    # 获取当前时间和时间戳
+    info_time = datetime.now()
+    timestamps = round(datetime.timestamp(info_time) * 1000)
+    news_time = info_time.strftime("%Y%m%d")
+
+    # 按城市分组，同城成员收到的内容完全相同
+    city_groups = {}
+    for user in users or []:
+        city_groups.setdefault(user_cities.get(user, default_city_code), []).append(user)
+    if toparty or totag:
+        city_groups.setdefault(default_city_code, [])
+
+    # 并发获取各板块：公共内容只获取一次，天气按城市各获取一次
+    sections = {
+        'news': ('news', get_news, (news_type, news_time)),
+        'financial': ('financial', get_financial_data, ()),
+        'sentence': ('sentence', get_sentence, ()),
+    }
+    for city_code in city_groups:
+        sections[f'weather:{city_code}'] = ('weather', weather_info, (cookie, city_code, timestamps))
+    results = fetch_sections(sections)
+
+    # 生成并发送消息
+    rate_limiter = RateLimiter(float(os.getenv("WEIXIN_SEND_RATE", 10)))
+
+    def send_city(city_code, city_users):
+        content = message_content(
+            results[f'weather:{city_code}'], info_time, results['news'], results['financial'], results['sentence']
+        )
+        is_default = city_code == default_city_code
+        return broadcast_message(
+            wxid, wxsecret, agentid, content, users=city_users,
+            toparty=toparty if is_default else None, totag=totag if is_default else None,
+            rate_limiter=rate_limiter,
+        )
+
+    with ThreadPoolExecutor(max_workers=int(os.getenv("WEIXIN_SEND_WORKERS", 4))) as executor:
+        futures = [executor.submit(send_city, city_code, city_users) for city_code, city_users in city_groups.items()]
+        sent = sum(future.result() for future in futures)
+    print(f"推送完成: {len(users or [])} 名成员, {len(city_groups)} 个城市, 共发送 {sent} 条消息")
+    http_client.log_stats()
+    content_cache.log_stats()
+
+def run_weather_push(touser):
+    """
+    获取天气、新闻、金融数据和每日金句，组装后推送给指定用户。
+    配置从环境变量读取，调用方需先加载 .env。
+
+    Args:
+        touser: 推送目标用户
+    """
+    run_weather_broadcast(users=[touser])
+
 if __name__ == '__main__':
     # 添加防止重复执行的机制
     import sys
-    import os
     
     # 检查是否已经有实例在运行
     lock_file = "/tmp/send_weather_message.lock"
@@ -192,39 +369,25 @@ if __name__ == '__main__':
     try:
         with open(lock_file, 'w') as f:
             f.write(str(os.getpid()))
-            
-        print("--- 开始获取信息 ---")
 
         # 加载环境变量
         from dotenv import load_dotenv
-        import os
         load_dotenv(dotenv_path='../.env')
 
-        # 用户名入参
-        if len(sys.argv) > 1:
-            touser = sys.argv[1]
+        if len(sys.argv) > 1 and sys.argv[1] == '--broadcast':
+            # 广播模式：成员可通过参数指定 (用 | 或 , 分隔)，否则读取 WEIXIN_TO_USER
+            to_users = sys.argv[2] if len(sys.argv) > 2 else os.getenv("WEIXIN_TO_USER", "")
+            users = [user.strip() for user in to_users.replace(',', '|').split('|') if user.strip()]
+            run_weather_broadcast(users=users, toparty=os.getenv("WEIXIN_TO_PARTY"), totag=os.getenv("WEIXIN_TO_TAG"))
         else:
-            # 如果没有提供命令行参数，则使用默认用户
-            touser = "HuangWeiShen"  # 默认用户
-
-        # 获取配置参数
-        city_code = os.getenv('WEATHER_CITY_CODE', '101190601')
-        cookie = os.getenv('WEATHER_COOKIE')
-        news_type = os.getenv('NEWS_TYPE', 'www_www_all_suda_suda')
-        wxid = os.getenv("WEIXIN_CORP_ID")
-        wxsecret = os.getenv("WEIXIN_CORP_SECRET")
-        agentid = os.getenv("WEIXIN_AGENT_ID")
-        # touser = os.getenv("WEIXIN_TO_USER")
-
-        # 获取当前时间和时间戳
-        info_time = datetime.now()
-        timestamps = round(datetime.timestamp(info_time) * 1000)
-        news_time = info_time.strftime("%Y%m%d")
-
-        # 生成并发送消息
-        content = message_content(city_code, timestamps, info_time, get_news(news_type, news_time), get_financial_data(), get_sentence())
-        from send_message import send_message
-        send_message(wxid, wxsecret, agentid, touser, content)
+            # 用户名入参
+            if len(sys.argv) > 1:
+                touser = sys.argv[1]
+            else:
+                # 如果没有提供命令行参数，则使用默认用户
+                touser = "HuangWeiShen"  # 默认用户
+
+            run_weather_push(touser)
     
     finally:
         # 删除锁文件
@@ -0,0 +1,142 @@
+"""
+@Time : 2026/10/18 00:10
+@Author : black_samurai
+@File : sender_blacklist.py
+@description : 发件人黑名单匹配，配置只编译一次：精确地址集合、域名后缀索引 (含子域名) 和合并后的通配规则
+"""
+
+import fnmatch
+import functools
+import re
+
+# 黑名单配置项的分隔符
+ENTRY_SEPARATOR_PATTERN = re.compile(r'[,;\s]+')
+WILDCARD_CHARS = frozenset('*?[')
+
+
+class SenderBlacklist:
+    """
+    编译后的发件人黑名单，匹配耗时与黑名单条数无关 (通配规则合并为一个正则)。
+
+    配置项格式 (不区分大小写)：
+    - user@example.com    精确匹配该地址
+    - example.com         匹配该域名及其所有子域名 (也可写作 @example.com)
+    - *.example.com       只匹配子域名，不含 example.com 本身
+    - noreply*@*、*-notice.com  其他通配规则：含@的匹配完整地址，不含@的匹配域名
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries: 黑名单配置项，字符串 (逗号、分号或空白分隔) 或字符串列表
+        """
+        if isinstance(entries, str):
+            entries = ENTRY_SEPARATOR_PATTERN.split(entries)
+        self.addresses = set()
+        self.domains = {}
+        self.subdomains = {}
+        address_patterns = []
+        domain_patterns = []
+        for entry in entries or []:
+            item = entry.strip().lower()
+            if not item:
+                continue
+            if item.startswith('@'):
+                item = item[1:]
+            if '@' in item:
+                if WILDCARD_CHARS.isdisjoint(item):
+                    self.addresses.add(item)
+                else:
+                    address_patterns.append(entry.strip())
+            elif item.startswith('*.') and WILDCARD_CHARS.isdisjoint(item[2:]):
+                self.subdomains.setdefault(item[2:], entry.strip())
+            elif item.startswith('.') and WILDCARD_CHARS.isdisjoint(item[1:]):
+                self.subdomains.setdefault(item[1:], entry.strip())
+            elif WILDCARD_CHARS.isdisjoint(item):
+                self.domains.setdefault(item, entry.strip())
+            else:
+                domain_patterns.append(entry.strip())
+        self.address_patterns = address_patterns
+        self.domain_patterns = domain_patterns
+        self._address_regex = self._compile(address_patterns)
+        self._domain_regex = self._compile(domain_patterns)
+
+    @staticmethod
+    def _compile(patterns):
+        # 每条规则一个捕获组，命中后由 lastindex 找回对应的配置项
+        if not patterns:
+            return None
+        return re.compile('|'.join(f'({fnmatch.translate(pattern.lower())})' for pattern in patterns))
+
+    def match(self, address):
+        """
+        判断发件人地址是否在黑名单中。
+
+        Args:
+            address: 发件人邮箱地址
+
+        Returns:
+            str | None: 命中的配置项，未命中时返回None
+        """
+        if not address:
+            return None
+        address = address.strip().lower()
+        if address in self.addresses:
+            return address
+        domain = address.rpartition('@')[2]
+        if self.domains or self.subdomains:
+            # 按域名后缀逐级查找：a.b.example.com -> b.example.com -> example.com -> com
+            suffix = domain
+            is_subdomain = False
+            while suffix:
+                entry = self.domains.get(suffix) or (self.subdomains.get(suffix) if is_subdomain else None)
+                if entry:
+                    return entry
+                suffix = suffix.partition('.')[2]
+                is_subdomain = True
+        if self._address_regex is not None:
+            match = self._address_regex.match(address)
+            if match:
+                return self.address_patterns[match.lastindex - 1]
+        if self._domain_regex is not None:
+            match = self._domain_regex.match(domain)
+            if match:
+                return self.domain_patterns[match.lastindex - 1]
+        return None
+
+    def __contains__(self, address):
+        return self.match(address) is not None
+
+    def __len__(self):
+        return (len(self.addresses) + len(self.domains) + len(self.subdomains)
+                + len(self.address_patterns) + len(self.domain_patterns))
+
+    def describe(self):
+        """
+        Returns:
+            str: 各类规则的条数
+        """
+        return (f"{len(self.addresses)} 个地址, {len(self.domains) + len(self.subdomains)} 个域名, "
+                f"{len(self.address_patterns) + len(self.domain_patterns)} 条通配规则")
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_cached(entries):
+    return SenderBlacklist(entries)
+
+
+def compile_blacklist(entries):
+    """
+    编译黑名单配置，相同配置在进程内只编译一次。
+
+    Args:
+        entries: 黑名单配置 (字符串、字符串列表或已编译的 SenderBlacklist)，None表示不启用
+
+    Returns:
+        SenderBlacklist: 编译后的黑名单
+    """
+    if isinstance(entries, SenderBlacklist):
+        return entries
+    if entries is None:
+        entries = ''
+    return _compile_cached(entries if isinstance(entries, str) else tuple(entries))
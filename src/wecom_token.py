@@ -0,0 +1,162 @@
+"""
+@Time : 2026/10/17 14:20
+@Author : black_samurai
+@File : wecom_token.py
+@description : 企业微信access_token管理，内存+磁盘缓存，过期前主动刷新，同一应用并发刷新只请求一次
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    from . import http_client
+except ImportError:
+    import http_client
+
+# access_token 失效的错误码：40014 不合法的access_token，42001 access_token已过期
+TOKEN_INVALID_ERRCODES = (40014, 42001)
+
+
+class TokenManager:
+    """
+    单个企业微信应用的access_token管理器。
+
+    - token缓存在内存中，并写入磁盘缓存文件，供定时任务等短生命周期进程共享
+    - 距过期不足 REFRESH_MARGIN 秒时主动刷新
+    - 刷新过程加锁，并发调用只向企业微信请求一次
+    """
+
+    # 提前刷新的秒数
+    REFRESH_MARGIN = 300
+
+    def __init__(self, corpid, corpsecret, cache_dir=None):
+        """
+        Args:
+            corpid: 企业微信CorpID
+            corpsecret: 企业微信应用Secret
+            cache_dir: 磁盘缓存目录，为None时使用系统临时目录，为空字符串时不使用磁盘缓存
+        """
+        self.corpid = corpid
+        self.corpsecret = corpsecret
+        if cache_dir is None:
+            cache_dir = tempfile.gettempdir()
+        if cache_dir:
+            secret_hash = hashlib.sha1(f"{corpid}:{corpsecret}".encode()).hexdigest()[:12]
+            self.cache_file = os.path.join(cache_dir, f"wecom_token_{secret_hash}.json")
+        else:
+            self.cache_file = None
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self):
+        return self._token is not None and time.time() < self._expires_at - self.REFRESH_MARGIN
+
+    def get_token(self):
+        """
+        获取可用的access_token，缓存即将过期时自动刷新。
+
+        Returns:
+            str | None: access_token，获取失败时返回None
+        """
+        if self._is_fresh():
+            return self._token
+        with self._lock:
+            # 等锁期间其他线程可能已经刷新完成
+            if self._is_fresh():
+                return self._token
+            if self._load_cache() and self._is_fresh():
+                return self._token
+            return self._refresh()
+
+    def invalidate(self, token):
+        """
+        标记token已失效 (如调用接口返回40014/42001)，下次获取时重新请求。
+        只有当前缓存的token与传入的相同时才清除，避免覆盖其他线程刚刷新的token。
+
+        Args:
+            token: 已失效的access_token
+        """
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0
+            if self.cache_file and os.path.exists(self.cache_file):
+                try:
+                    with open(self.cache_file, 'r', encoding='utf-8') as f:
+                        cached = json.load(f)
+                    if cached.get('access_token') == token:
+                        os.remove(self.cache_file)
+                except (OSError, ValueError):
+                    pass
+
+    def _refresh(self):
+        token_url = 'https://qyapi.weixin.qq.com/cgi-bin/gettoken'
+        try:
+            token_response = http_client.get(
+                token_url, params={'corpid': self.corpid, 'corpsecret': self.corpsecret}, timeout=10
+            ).json()
+        except Exception as e:
+            print(f"获取token异常: {e}")
+            return None
+        if token_response.get('errcode') != 0:
+            print(f"获取token失败: {token_response.get('errmsg', '未知错误')}")
+            return None
+        self._token = token_response['access_token']
+        self._expires_at = time.time() + int(token_response.get('expires_in', 7200))
+        self._save_cache()
+        return self._token
+
+    def _load_cache(self):
+        if not self.cache_file:
+            return False
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self._token = cached['access_token']
+            self._expires_at = float(cached['expires_at'])
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        try:
+            # 先写临时文件再替换，避免其他进程读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.cache_file), prefix='.wecom_token_')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'access_token': self._token, 'expires_at': self._expires_at}, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"写入token缓存失败: {e}")
+
+
+# 进程内的token管理器，按 (CorpID, Secret) 区分
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(corpid, corpsecret):
+    """
+    获取指定应用的token管理器，同一应用在进程内共用一个实例。
+    磁盘缓存目录由环境变量 WEIXIN_TOKEN_CACHE_DIR 指定，未配置时使用系统临时目录，配置为空时不使用磁盘缓存。
+
+    Args:
+        corpid: 企业微信CorpID
+        corpsecret: 企业微信应用Secret
+
+    Returns:
+        TokenManager: token管理器
+    """
+    key = (corpid, corpsecret)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = TokenManager(corpid, corpsecret, cache_dir=os.getenv("WEIXIN_TOKEN_CACHE_DIR"))
+            _managers[key] = manager
+        return manager